@@ -221,6 +221,63 @@ class Configuration:
                 "Log expire interval cannot be shorter than the log rotation interval"
             )
 
+        # Verify that the packet loss thresholds are valid.
+        self.packet_loss_thresholds()
+
+        # Verify that the cron task intervals are valid.
+        self.cron_task_intervals()
+
+        if not 0 <= self.config["crondaemonjitter"] <= 100:
+            raise ConfigurationError(
+                f"CronDaemonJitter option value must be between 0 and 100: {self.config['crondaemonjitter']}"
+            )
+
+        levels = {"gzip": (1, 9), "zstd": (1, 22), "lz4": (0, 16)}
+        codec = self.config["compresscodec"]
+        if codec:
+            if codec not in levels:
+                raise ConfigurationError(
+                    f"CompressCodec option value must be one of {', '.join(levels)}: {codec}"
+                )
+
+            minlevel, maxlevel = levels[codec]
+            if not minlevel <= self.config["compresslevel"] <= maxlevel:
+                raise ConfigurationError(
+                    f"CompressLevel option value for codec {codec} must be between {minlevel} and {maxlevel}: {self.config['compresslevel']}"
+                )
+
+            if self.config["compressthreads"] < 1:
+                raise ConfigurationError(
+                    f"CompressThreads option value must be at least 1: {self.config['compressthreads']}"
+                )
+
+        if self.config["archiverthreads"] < 1:
+            raise ConfigurationError(
+                f"ArchiverThreads option value must be at least 1: {self.config['archiverthreads']}"
+            )
+
+        if self.config["fetchchunksize"] < 1:
+            raise ConfigurationError(
+                f"FetchChunkSize option value must be at least 1: {self.config['fetchchunksize']}"
+            )
+
+        if self.config["installtransport"] not in ("rsync", "archive"):
+            raise ConfigurationError(
+                f"InstallTransport option value must be one of rsync, archive: {self.config['installtransport']}"
+            )
+
+        for opt in (
+            "DiskFullHorizon",
+            "DiskForecastWindow",
+            "PostProcMaxJobs",
+            "SyncMaxJobs",
+            "TailMaxLines",
+        ):
+            if self.config[opt.lower()] < 0:
+                raise ConfigurationError(
+                    f"{opt} option value cannot be negative: {self.config[opt.lower()]}"
+                )
+
         if self.config["usewebsocket"]:
             if events.websockets_errmsg is not None:
                 self.ui.warn(
@@ -438,6 +495,65 @@ class Configuration:
 
         return env_vars
 
+    # Returns a tuple of the global packet loss threshold (in percent) and a
+    # dict that maps node names (or names of node.cfg entries with lb_procs)
+    # to node-specific thresholds.
+    def packet_loss_thresholds(self):
+        try:
+            threshold = float(self.config["packetlossthreshold"])
+        except ValueError:
+            raise ConfigurationError(
+                f"PacketLossThreshold option value must be a number: {self.config['packetlossthreshold']}"
+            )
+
+        nodethresholds = {}
+        text = self.config["packetlossnodethresholds"]
+        if text:
+            for keyval in text.split(","):
+                try:
+                    key, val = keyval.split("=", 1)
+                    nodethresholds[key.strip()] = float(val)
+                except ValueError:
+                    raise ConfigurationError(
+                        f"PacketLossNodeThresholds option value must be of the form <node>=<number>: {keyval}"
+                    )
+
+        return threshold, nodethresholds
+
+    # Returns a dict that maps the name of each cron task to the interval (in
+    # seconds) at which "zeekctl cron --daemon" runs it.  Disabled tasks are
+    # not included.
+    def cron_task_intervals(self):
+        from ZeekControl import cron
+
+        intervals = dict(cron.TASKS)
+
+        text = self.config["crondaemontaskintervals"]
+        if text:
+            for keyval in text.split(","):
+                try:
+                    key, val = keyval.split("=", 1)
+                    key = key.strip()
+                    val = int(val)
+                except ValueError:
+                    raise ConfigurationError(
+                        f"CronDaemonTaskIntervals option value must be of the form <task>=<seconds>: {keyval}"
+                    )
+
+                if key not in intervals:
+                    raise ConfigurationError(
+                        f"CronDaemonTaskIntervals option contains an unknown task: {key}"
+                    )
+
+                if val < 0:
+                    raise ConfigurationError(
+                        f"CronDaemonTaskIntervals option value must not be negative: {keyval}"
+                    )
+
+                intervals[key] = val
+
+        return {key: val for key, val in intervals.items() if val > 0}
+
     # Parse node.cfg.
     def _read_nodes(self):
         config = configparser.ConfigParser()
@@ -914,6 +1030,12 @@ class Configuration:
         self.set_state("configchksum", self._get_zeekctlcfg_hash(filehash=True))
         self.set_state("confignodechksum", self._get_nodecfg_hash(filehash=True))
 
+    # Returns a hash of the current contents of the zeekctl config files.
+    def get_cfg_hash(self):
+        return self._get_zeekctlcfg_hash(filehash=True) + self._get_nodecfg_hash(
+            filehash=True
+        )
+
     # Returns True if the zeekctl config files have changed since last reload.
     def is_cfg_changed(self):
         try:
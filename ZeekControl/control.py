@@ -6,9 +6,36 @@ import os
 import shutil
 import time
 from collections import namedtuple
-
-from ZeekControl import cmdresult, config, cron, events, execute, install, util
+from concurrent import futures
+
+from ZeekControl import (
+    cmdresult,
+    config,
+    cron,
+    events,
+    execute,
+    install,
+    manifest,
+    messagedb,
+    statsdb,
+    tail,
+    util,
+)
 from ZeekControl import node as node_mod
+from ZeekControl.exceptions import RuntimeEnvironmentError
+
+# The maximum number of bytes of a node's file that summarize_messages reads
+# at once.
+MESSAGES_MAXBYTES = 64 * 1024 * 1024
+
+# The maximum number of matching lines that logs_find returns per host, as
+# the output of the archive-index helper is buffered in memory and must
+# arrive within the command timeout.
+LOGS_FIND_MAXMATCHES = 1000
+
+# The output of the procstats helper on hosts without a Linux-style /proc
+# filesystem.
+PROCSTATS_UNSUPPORTED = "no /proc filesystem available"
 
 
 # Waits for the nodes' Zeek processes to reach the given status.
@@ -103,6 +130,9 @@ class Controller:
         self.executor = executor
         self.pluginregistry = pluginregistry
 
+        # The hosts on which the procstats helper doesn't work.
+        self._noprocstats = set()
+
         # Create zeekctl-config.sh file so that shell script helpers have
         # current config values.
         install.make_zeekctl_config_sh(ui)
@@ -143,6 +173,15 @@ class Controller:
         if workers:
             self._start_nodes(workers, results)
 
+            started = {n.name for n, success, _ in results.nodes if success}
+            for node, netif, success, output in self.start_capstats_collectors(
+                [n for n in workers if n.name in started]
+            ):
+                if not success:
+                    self.ui.error(
+                        f"failed to start capstats collector for {netif} on {node.host}: {output}"
+                    )
+
         return results
 
     # Starts the given nodes.
@@ -453,6 +492,9 @@ class Controller:
         if loggers:
             self._stop_nodes(loggers, results)
 
+        if workers:
+            self.stop_capstats_collectors(workers)
+
         return results
 
     def _stop_nodes(self, nodes, results):
@@ -877,23 +919,34 @@ class Controller:
     # If there is more than one node, then the results will also contain
     # one "pseudo-node" of the name "$total" with the sum of all individual
     # values.
+    #
+    # If capstats collectors are enabled, then the values are the averages
+    # of the samples the collectors took over the last 'interval' seconds.
+    # Capstats is only run for interfaces that have no such samples.
     def get_capstats_output(self, nodes, interval):
         results = []
 
-        # Construct a list of (node, interface) tuples, one tuple for each
-        # unique (host, interface) pair.
-        nodenetifs = []
-        hosts = {}
-        for node in nodes:
-            if not node.interface:
-                continue
+        nodenetifs = self._capstats_nodenetifs(nodes)
 
-            netif = self._capstats_interface(node)
-            if not netif:
-                continue
+        if self.config.capstatscollector:
+            missing = []
+            capstats = self.get_capstats_samples(nodes, interval=interval)
+            for node, netif, success, samples in capstats:
+                if success and samples:
+                    vals = {}
+                    for _, svals in samples:
+                        for key, val in svals.items():
+                            vals[key] = vals.get(key, 0.0) + val
 
-            if hosts.setdefault((node.addr, netif), node) == node:
-                nodenetifs.append((node, netif))
+                    # Round to avoid floating-point noise in the averages.
+                    for key, val in vals.items():
+                        vals[key] = round(val / len(samples), 6)
+
+                    results += [(node, netif, True, vals)]
+                else:
+                    missing.append((node, netif))
+
+            nodenetifs = missing
 
         capstats = self.config.capstatspath
         cmds = [
@@ -901,9 +954,7 @@ class Controller:
             for (node, interface) in nodenetifs
         ]
 
-        outputs = self.executor.run_cmds(cmds)
-
-        totals = {}
+        outputs = self.executor.run_cmds(cmds) if cmds else []
 
         for node, success, output in outputs:
             netif = self._capstats_interface(node)
@@ -933,9 +984,9 @@ class Controller:
                 results += [(node, netif, False, f"{node.name}: no capstats output")]
                 continue
 
-            fields = outputline.split()[1:]
-
-            if not fields:
+            try:
+                vals = self._parse_capstats_line(outputline)
+            except ValueError:
                 results += [
                     (
                         node,
@@ -946,38 +997,166 @@ class Controller:
                 ]
                 continue
 
-            vals = {}
+            results += [(node, netif, True, vals)]
 
-            try:
-                for field in fields:
-                    key, val = field.split("=")
-                    val = float(val)
-                    vals[key] = val
+        # Add pseudo-node for totals when there is more than one result
+        if len(results) > 1:
+            results += [
+                (
+                    node_mod.Node(self.config, "$total"),
+                    None,
+                    True,
+                    self._capstats_totals(results),
+                )
+            ]
 
-                    if key in totals:
-                        totals[key] += val
-                    else:
-                        totals[key] = val
+        return results
 
-            except ValueError:
+    # Read the samples that the capstats collectors took on the interfaces of
+    # the given nodes, either after the time given by 'since' (a dict mapping
+    # node names to times in seconds since the epoch on the node's host,
+    # where nodes not in the dict get all samples), or within the last
+    # 'interval' seconds.
+    #
+    # Returns a list of tuples of the form (node, netif, success, samples)
+    # where 'samples' is a list of (time, vals) tuples (with 'vals' as in
+    # get_capstats_output), or an error message if 'success' is False.
+    def get_capstats_samples(self, nodes, since=None, interval=None):
+        results = []
+
+        cmds = []
+        for node, netif in self._capstats_nodenetifs(nodes):
+            if interval is not None:
+                args = ["recent", netif, str(interval)]
+            else:
+                args = ["read", netif, str((since or {}).get(node.name, 0))]
+
+            cmds += [(node, "capstats-collector", args)]
+
+        for node, success, output in self.executor.run_helper(cmds):
+            netif = self._capstats_interface(node)
+
+            if not success:
+                errmsg = output.splitlines()[0] if output else ""
                 results += [
                     (
                         node,
                         netif,
                         False,
-                        f"{node.name}: unexpected capstats output: {outputline}",
+                        f"{node.name}: reading capstats collector failed ({errmsg})",
                     )
                 ]
                 continue
 
-            results += [(node, netif, True, vals)]
+            samples = []
+            for line in output.splitlines():
+                # The first field is the time the sample was taken, the rest
+                # is the capstats output (which might be an error message).
+                t, _, outputline = line.partition(" ")
+                try:
+                    samples.append((float(t), self._parse_capstats_line(outputline)))
+                except ValueError:
+                    continue
 
-        # Add pseudo-node for totals when there is more than one result
-        if len(results) > 1:
-            results += [(node_mod.Node(self.config, "$total"), None, True, totals)]
+            results += [(node, netif, True, samples)]
+
+        return results
+
+    # Start the capstats collectors for the given nodes (if enabled).
+    #
+    # Returns a list of tuples of the form (node, netif, success, output)
+    # where 'output' is "started" if the collector was started, "running" if
+    # it was already running, or an error message.
+    def start_capstats_collectors(self, nodes):
+        results = []
+
+        if not self.config.capstatscollector or not self.config.capstatspath:
+            return results
+
+        cmds = [
+            (node, "capstats-collector", ["start", netif])
+            for (node, netif) in self._capstats_nodenetifs(nodes)
+        ]
+
+        for node, success, output in self.executor.run_helper(cmds):
+            netif = self._capstats_interface(node)
+            results += [(node, netif, success, output.strip())]
 
         return results
 
+    # Stop the capstats collectors for the given nodes, except for those that
+    # are still needed by other nodes which are expected to be running.
+    def stop_capstats_collectors(self, nodes):
+        if not self.config.capstatscollector:
+            return
+
+        needed = {
+            (n.addr, netif)
+            for n, netif in self._capstats_nodenetifs(self.config.nodes())
+            if n.getExpectRunning()
+        }
+
+        cmds = [
+            (node, "capstats-collector", ["stop", netif])
+            for (node, netif) in self._capstats_nodenetifs(nodes)
+            if (node.addr, netif) not in needed
+        ]
+
+        for node, success, output in self.executor.run_helper(cmds):
+            if not success:
+                netif = self._capstats_interface(node)
+                self.ui.error(
+                    f"failed to stop capstats collector for {netif} on {node.host}: {output}"
+                )
+
+    # Returns a list of (node, netif) tuples, one tuple for each unique
+    # (host, interface) pair of the given nodes, where 'netif' is the network
+    # interface name used by capstats.
+    def _capstats_nodenetifs(self, nodes):
+        nodenetifs = []
+        hosts = {}
+        for node in nodes:
+            if not node.interface:
+                continue
+
+            netif = self._capstats_interface(node)
+            if not netif:
+                continue
+
+            if hosts.setdefault((node.addr, netif), node) == node:
+                nodenetifs.append((node, netif))
+
+        return nodenetifs
+
+    # Parse a line of capstats output (without the leading timestamp) and
+    # return a dict that maps tags to their values.  Raises ValueError if
+    # the line cannot be parsed.
+    def _parse_capstats_line(self, line):
+        fields = line.split()[1:]
+
+        if not fields:
+            raise ValueError(line)
+
+        vals = {}
+        for field in fields:
+            key, val = field.split("=")
+            vals[key] = float(val)
+
+        return vals
+
+    # Returns the sum of the values of all successful capstats results.
+    def _capstats_totals(self, results):
+        totals = {}
+
+        for _, _, success, vals in results:
+            if not success:
+                continue
+
+            for key, val in vals.items():
+                totals[key] = totals.get(key, 0.0) + val
+
+        return totals
+
     # Convert a Zeek network interface name to one that capstats can use.
     def _capstats_interface(self, node):
         netif = node.interface
@@ -1004,8 +1183,10 @@ class Controller:
     # Returns a list of the form:  [ (host, diskinfo), ...]
     # where diskinfo is a list of the form DiskInfo named tuple objects (fs,
     # total, used, avail, percent) or ["FAIL", <error message>] if an error
-    # is encountered.
-    def df(self, nodes):
+    # is encountered.  If a dict "fsdirs" is given, it is filled with the
+    # tuples of the names of the zeekctl options whose directories are on
+    # each filesystem (e.g. "logdir"), keyed by (node name, fs).
+    def df(self, nodes, fsdirs=None):
         results = cmdresult.CmdResult()
 
         DiskInfo = namedtuple(
@@ -1030,7 +1211,10 @@ class Controller:
             df[node.name] = {}
 
         cmds = []
+        # The keys of each node's commands, in the order of the results.
+        keys = {}
         for node in nodes:
+            keys[node.name] = []
             for key in dirs:
                 if key == "logdir" and not (
                     node_mod.is_logger(node)
@@ -1047,8 +1231,10 @@ class Controller:
                         continue
 
                 cmds += [(node, "df", [path])]
+                keys[node.name].append(key)
 
         for node, success, output in self.executor.run_helper(cmds):
+            key = keys[node.name].pop(0)
             if success:
                 fields = output.split()
                 if len(fields) != 4:
@@ -1070,6 +1256,9 @@ class Controller:
 
                 perc = used * 100.0 / (used + avail)
                 df[node.name][fs] = DiskInfo(fs, total, used, avail, perc)
+                if fsdirs is not None:
+                    fskey = (node.name, fs)
+                    fsdirs[fskey] = fsdirs.get(fskey, ()) + (key,)
             else:
                 df[node.name]["FAIL"] = output if output else "no output"
 
@@ -1079,6 +1268,239 @@ class Controller:
 
         return results
 
+    # Find the archived logs of the given types (or of all types if empty)
+    # which cover any part of the time range from start to end (None for
+    # either means unbounded), using the archive index on each host that
+    # archives logs.  If grep is given, only the logs which contain that
+    # string within the time range are returned.  The data of each host's
+    # node has a "logs" list of dicts with the keys "path", "type", "start",
+    # "end", "size", "lines" (each None if unknown), and "matches" (the lines
+    # containing the grep string), and "truncated" is True if the search
+    # stopped after LOGS_FIND_MAXMATCHES matching lines.
+    def logs_find(self, types, start, end, grep=None):
+        results = cmdresult.CmdResult()
+
+        nodes = self.config.hosts(tag=node_mod.logger_group())
+        if not nodes:
+            nodes = self.config.hosts(tag=node_mod.manager_group())
+        if not nodes:
+            nodes = self.config.hosts()
+
+        args = ["find"]
+        if types:
+            args += ["--type", ",".join(types)]
+        if start is not None:
+            args += ["--from", str(int(start))]
+        if end is not None:
+            args += ["--to", str(int(end))]
+        if grep:
+            args += ["--grep", grep, "--max-matches", str(LOGS_FIND_MAXMATCHES)]
+        args.append(self.config.logdir)
+
+        archiveindex = os.path.join(self.config.scriptsdir, "archive-index")
+        cmds = [(node, archiveindex, args) for node in nodes]
+
+        for node, success, output in self.executor.run_cmds(cmds):
+            logs = []
+            errors = []
+            truncated = False
+
+            for line in output.splitlines():
+                if line.startswith("F "):
+                    fields = line[2:].split(" ", 5)
+                    if len(fields) != 6:
+                        errors.append(line)
+                        continue
+
+                    vals = [None if f == "-" else f for f in fields]
+                    logs.append(
+                        {
+                            "start": int(vals[0]) if vals[0] else None,
+                            "end": int(vals[1]) if vals[1] else None,
+                            "size": int(vals[2]) if vals[2] else None,
+                            "lines": int(vals[3]) if vals[3] else None,
+                            "type": vals[4],
+                            "path": vals[5],
+                            "matches": [],
+                        }
+                    )
+                elif line.startswith("M ") and logs:
+                    logs[-1]["matches"].append(line[2:])
+                elif line.startswith("T "):
+                    truncated = True
+                elif line:
+                    errors.append(line)
+
+            if errors:
+                self.ui.error(f"archive-index on {node.host}: " + "\n".join(errors))
+
+            if not success:
+                results.ok = False
+
+            results.set_node_data(node, success, {"logs": logs, "truncated": truncated})
+
+        return results
+
+    # Copy the given file or directory from each of the given nodes into a
+    # subdirectory of "destdir" named after the node.  A relative path is
+    # relative to the working directory of the node.
+    def fetch(self, nodes, path, destdir):
+        results = cmdresult.CmdResult()
+
+        files = [
+            (node, os.path.join(node.cwd(), path), os.path.join(destdir, node.name))
+            for node in nodes
+        ]
+
+        for node, success, output in self.executor.fetch(
+            files, self.config.fetchchunksize
+        ):
+            results.set_node_output(node, success, output)
+
+        return results
+
+    # Follow the given file in the working directory of each of the given
+    # nodes, starting with its last "lines" lines, and yield (node, line)
+    # tuples as lines are appended (see the tail module for how the amount of
+    # output is limited).  Unless "follow" is true, only the last lines are
+    # yielded.  Nodes whose file cannot be read are reported and dropped.
+    def tail(self, nodes, filename, lines=10, follow=True, interval=1.0):
+        tails = {
+            node.name: tail.LogTail(
+                os.path.join(node.cwd(), filename), lines, self.config.tailmaxlines
+            )
+            for node in nodes
+        }
+
+        while nodes:
+            start = time.time()
+            cmds = [(node, "read-file", tails[node.name].args()) for node in nodes]
+
+            failed = set()
+            for node, success, output in self.executor.run_helper(cmds):
+                try:
+                    if not success:
+                        raise ValueError(output)
+                    newlines = tails[node.name].feed(output, time.time())
+                except ValueError as err:
+                    self.ui.error(f"cannot read {filename} of {node.name}: {err}")
+                    failed.add(node.name)
+                    continue
+
+                for line in newlines:
+                    yield node, line
+
+            nodes = [node for node in nodes if node.name not in failed]
+
+            if not follow:
+                break
+
+            time.sleep(max(interval - (time.time() - start), 0))
+
+    # Read the new lines of the stderr.log file of each of the given nodes,
+    # and of the reporter.log file of the nodes that write the logs, and add
+    # the counts of their distinct messages to the message database.  Each
+    # file is read from where the previous call left off (or from the start
+    # if it was rotated).  If more than MESSAGES_MAXBYTES of a file are
+    # unread, only its last MESSAGES_MAXBYTES are read.  Lines written to a
+    # file after it was last read and before it was rotated are not counted.
+    # Returns a tuple of a list of (node, level, template, example) tuples of
+    # the templates that were not seen before, and a list of (node, filename,
+    # bytes) tuples of the files of which bytes were skipped.  Raises
+    # RuntimeEnvironmentError if the database cannot be updated.
+    def summarize_messages(self, nodes):
+        loggers = [n for n in self.config.nodes() if node_mod.is_logger(n)]
+
+        files = []
+        for node in nodes:
+            files.append((node, "stderr.log"))
+            if (
+                node_mod.is_logger(node)
+                or (node_mod.is_manager(node) and not loggers)
+                or node_mod.is_standalone(node)
+            ):
+                files.append((node, "reporter.log"))
+
+        store = messagedb.MessageStore(self.config.messagedb)
+        new = []
+        skipped = []
+
+        try:
+            cmds = []
+            # The files of each node, in the order of the results.
+            pending = {node.name: [] for node in nodes}
+            for node, filename in files:
+                inode, offset = store.get_offset(node.name, filename)
+                path = os.path.join(node.cwd(), filename)
+                args = [path, str(inode), str(offset), str(MESSAGES_MAXBYTES)]
+                cmds.append((node, "summarize-messages", args))
+                pending[node.name].append(filename)
+
+            t = time.time()
+
+            for node, success, output in self.executor.run_helper(cmds):
+                filename = pending[node.name].pop(0)
+                lines = output.splitlines()
+                if not success or not lines:
+                    self.ui.error(
+                        f"failed to read {filename} of {node.name}: {output.strip()}"
+                    )
+                    continue
+
+                if lines[0] == "-":
+                    continue
+
+                try:
+                    inode, offset, _, nskipped = (int(v) for v in lines[0].split())
+                    messages = []
+                    for line in lines[1:]:
+                        count, level, template, example = line.split("\t", 3)
+                        messages.append((int(count), level, template, example))
+                except ValueError:
+                    self.ui.error(
+                        f"unexpected output of summarize-messages for {node.name}: {output}"
+                    )
+                    continue
+
+                for level, template, example in store.add(
+                    node.name, filename, inode, offset, messages, t
+                ):
+                    new.append((node, level, template, example))
+
+                if nskipped:
+                    skipped.append((node, filename, nskipped))
+        finally:
+            store.close()
+
+        return new, skipped
+
+    # Return a list of the "top" most frequent messages of the given nodes (see
+    # MessageStore.top), after reading the new lines of their files.  If
+    # "reset" is true, then all counts are reset first.
+    def messages(self, nodes, top=10, reset=False):
+        results = cmdresult.CmdResult()
+
+        try:
+            if reset:
+                store = messagedb.MessageStore(self.config.messagedb)
+                store.reset()
+                store.close()
+
+            _, skipped = self.summarize_messages(nodes)
+            for node, filename, nbytes in skipped:
+                self.ui.warn(
+                    f"skipped {nbytes} bytes of {filename} of {node.name} (more than {MESSAGES_MAXBYTES} bytes unread)"
+                )
+
+            store = messagedb.MessageStore(self.config.messagedb)
+            results.keyval = store.top(top, [n.name for n in nodes])
+            store.close()
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to update message database: {err}")
+            results.ok = False
+
+        return results
+
     # Returns a list of tuples of the form (node, error, vals) where 'error' is
     # an error message string, or None if there was no error.  'vals' is a
     # dict which maps tags to their values.  Tags are "pid", "vsize",
@@ -1102,81 +1524,151 @@ class Controller:
         if not pids:
             return results
 
-        cmds = []
-        hosts = {}
-
-        # Now run top once per host.
-        for node in nodes:  # Do the loop again to keep the order.
-            if node.name not in pids:
-                continue
-
-            if node.host in hosts:
-                continue
-
-            hosts[node.host] = 1
-
-            cmds += [(node, "top", [])]
+        # Sample just the Zeek processes from /proc instead of running top,
+        # except on the hosts that don't have a Linux-style /proc filesystem.
+        helpers = {}
+        for node in nodes:
+            if node.name in pids and node.host not in helpers:
+                noproc = node.host in self._noprocstats
+                helpers[node.host] = "top" if noproc else "procstats"
 
-        if not cmds:
-            return results
+        res = self._run_top_helpers(nodes, pids, helpers)
 
-        res = {}
-        for node, success, output in self.executor.run_helper(cmds):
-            res[node.host] = success, output
+        retry = [
+            host
+            for host, (success, output) in res.items()
+            if not success and output.startswith(PROCSTATS_UNSUPPORTED)
+        ]
+        if retry:
+            for host in retry:
+                self._noprocstats.add(host)
+                helpers[host] = "top"
+            res.update(self._run_top_helpers(nodes, pids, {h: "top" for h in retry}))
 
         # Gather results for all the nodes that are running
         for node in nodes:
             if node.name not in pids:
                 continue
 
+            helper = helpers[node.host]
             success, output = res[node.host]
 
             if not success:
                 # The error msg gets written to stats.log, so we only want
                 # the first line.
                 errmsg = output.splitlines()[0] if output else ""
-                results += [(node, f"top failed: {errmsg}", {})]
+                results += [(node, f"{helper} failed: {errmsg}", {})]
                 continue
 
             if not output:
-                results += [(node, "no output from top", {})]
+                results += [(node, f"no output from {helper}", {})]
                 continue
 
-            # Get the zeek process info, which is a list of fields from
-            # the "top" helper.
-            procinfo = []
             try:
-                for line in output.splitlines():
-                    if int(line.split()[0]) == pids[node.name]:
-                        procinfo = line.split()
-                        break
-            except (IndexError, ValueError) as err:
-                results += [(node, f"bad output from top: {err}", {})]
+                if helper == "procstats":
+                    vals = self._parse_procstats_output(output, pids[node.name])
+                else:
+                    vals = self._parse_top_output(output, pids[node.name])
+            except (IndexError, KeyError, ValueError) as err:
+                results += [(node, f"unexpected {helper} output: {err}", {})]
                 continue
 
-            if not procinfo:
+            if not vals:
                 # It's possible that the process is no longer there.
                 results += [(node, "not running", {})]
                 continue
 
-            vals = {}
+            results += [(node, None, vals)]
 
-            try:
-                pid = int(procinfo[0])
-                vals["pid"] = pid
-                vals["vsize"] = int(
-                    float(procinfo[1])
-                )  # May be something like 2.17684e+9
-                vals["rss"] = int(float(procinfo[2]))
-                vals["cpu"] = procinfo[3]
-                vals["cmd"] = " ".join(procinfo[4:])
-            except (IndexError, ValueError) as err:
-                results += [(node, f"unexpected top output: {err}", {})]
+        return results
+
+    # Run the given helper ("procstats" or "top") once on each host of the
+    # "helpers" dict, which maps hosts to helpers, for the given nodes whose
+    # PIDs are given in the "pids" dict.  Returns a dict that maps each host
+    # to a tuple (success, output).
+    def _run_top_helpers(self, nodes, pids, helpers):
+        cmds = {}
+        for node in nodes:  # Keep the order of the nodes.
+            if node.name not in pids or node.host not in helpers:
                 continue
 
-            results += [(node, None, vals)]
+            if helpers[node.host] == "top":
+                if node.host not in cmds:
+                    cmds[node.host] = (node, "top", [])
+                continue
 
-        return results
+            if node.host not in cmds:
+                cmds[node.host] = (node, "procstats", ["1"])
+            cmds[node.host][2].append(str(pids[node.name]))
+
+        res = {}
+        for node, success, output in self.executor.run_helper(list(cmds.values())):
+            res[node.host] = success, output
+
+        return res
+
+    # Find the lines for the given pid in the output of the "procstats" helper
+    # and return a dict of their values, or an empty dict if there are none.
+    # The per-thread values are stored as a dict in "threadgroups" which maps
+    # each thread group name to a dict of its values.
+    def _parse_procstats_output(self, output, pid):
+        vals = {}
+        threadgroups = {}
+
+        for line in output.splitlines():
+            if line.startswith("thread "):
+                tvals = dict(field.split("=", 1) for field in line.split()[1:])
+                if int(tvals.pop("pid")) != pid:
+                    continue
+
+                name = tvals.pop("name")
+                threadgroups[name] = {key: int(val) for key, val in tvals.items()}
+                continue
+
+            fields, _, cmd = line.partition(" cmd=")
+            pvals = dict(field.split("=", 1) for field in fields.split())
+
+            if int(pvals["pid"]) != pid:
+                continue
+
+            for key in ("pid", "vsize", "rss"):
+                pvals[key] = int(pvals[key])
+            for key in ("utime", "stime"):
+                pvals[key] = float(pvals[key])
+            for key in ("threads", "vctxsw", "nvctxsw", "read_bytes", "write_bytes"):
+                if key in pvals:
+                    pvals[key] = int(pvals[key])
+            pvals["cmd"] = cmd
+
+            vals = pvals
+
+        if vals:
+            vals["threadgroups"] = threadgroups
+
+        return vals
+
+    # Find the line for the given pid in the output of the "top" helper and
+    # return a dict of its values, or an empty dict if there is none.
+    def _parse_top_output(self, output, pid):
+        # Get the zeek process info, which is a list of fields from
+        # the "top" helper.
+        procinfo = []
+        for line in output.splitlines():
+            if int(line.split()[0]) == pid:
+                procinfo = line.split()
+                break
+
+        if not procinfo:
+            return {}
+
+        vals = {}
+        vals["pid"] = int(procinfo[0])
+        vals["vsize"] = int(float(procinfo[1]))  # May be something like 2.17684e+9
+        vals["rss"] = int(float(procinfo[2]))
+        vals["cpu"] = procinfo[3]
+        vals["cmd"] = " ".join(procinfo[4:])
+
+        return vals
 
     # Produce a top-like output for node's processes.
     def top(self, nodes):
@@ -1192,6 +1684,7 @@ class Controller:
                 "rss": None,
                 "cpu": None,
                 "cmd": None,
+                "threadgroups": None,
                 "error": None,
             }
             if error:
@@ -1206,6 +1699,172 @@ class Controller:
 
         return results
 
+    # Run the given cron tasks concurrently, except that a task is started
+    # only once the tasks it depends on (see cron.task_dependencies) have
+    # finished.  The output of each task is buffered separately, and a list
+    # of the outputs is returned in the order of the given tasks.  A task
+    # that raises an exception gets the error in its output, and the tasks
+    # depending on it are skipped; the other tasks are not affected.
+    def _run_cron_tasks(self, tasks, executor):
+        if not tasks:
+            return []
+
+        # Each task returns a (success, output) tuple.
+        def run(name, deps):
+            futures.wait(deps.values())
+
+            failed = [dep for dep, f in deps.items() if not f.result()[0]]
+            if failed:
+                return (
+                    False,
+                    f"cron task {name} skipped: {', '.join(failed)} failed\n",
+                )
+
+            cronui = cron.CronUI()
+            cronui.buffer_output()
+            crontasks = cron.CronTasks(
+                cronui, self.config, self, executor, self.pluginregistry
+            )
+
+            success = True
+            try:
+                crontasks.run(name)
+            except Exception as err:
+                logging.exception("cron task %s failed", name)
+                cronui.error(f"cron task {name} failed: {err}")
+                success = False
+
+            return (success, cronui.get_buffered_output())
+
+        # A task can depend only on tasks that were submitted before it.
+        running = {}
+        with futures.ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+            for name in tasks:
+                deps = {
+                    dep: running[dep] for dep in cron.task_dependencies(name, running)
+                }
+                running[name] = pool.submit(run, name, deps)
+
+        return [running[name].result()[1] for name in tasks]
+
+    # Query the stats database for the given metrics of the given nodes
+    # within the time range [start, end), and aggregate the values by node,
+    # node type, or host (or over all nodes).  The results contain one
+    # ((group, type, metric), vals) tuple per group in the keyval list, where
+    # "vals" maps each aggregation function to its value.
+    def stats(self, nodes, metrics, start, end, aggs, groupby):
+        results = cmdresult.CmdResult()
+
+        store = self._open_statsdb(results)
+        if not store:
+            return results
+
+        try:
+            tier, rows = store.rollup(
+                start, end, nodes=[n.name for n in nodes], metrics=metrics
+            )
+            store.close()
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to query stats database: {err}")
+            results.ok = False
+            return results
+
+        nodemap = {n.name: n for n in nodes}
+        groupkeys = {
+            "node": lambda row: row[1],
+            "type": lambda row: nodemap[row[1]].type,
+            "host": lambda row: nodemap[row[1]].host,
+            "all": lambda row: "all",
+        }
+
+        results.keyval = statsdb.aggregate(rows, aggs, groupkeys[groupby])
+
+        # Let the caller know which tier of the database the values were
+        # aggregated from (zero means raw samples).
+        for _, vals in results.keyval:
+            vals["resolution"] = tier
+
+        return results
+
+    # Return the time series of the given metrics of each of the given nodes
+    # within the time range [start, end) from the stats database.  For each
+    # node, the result data contains the resolution (i.e., the tier of the
+    # database, with zero meaning raw samples) and a "series" dict that maps
+    # "<type>:<metric>" to a list of [time, avg, min, max] values.
+    def stats_series(self, nodes, metrics, start, end, resolution=None):
+        results = cmdresult.CmdResult()
+
+        store = self._open_statsdb(results)
+        if not store:
+            return results
+
+        try:
+            tier, rows = store.rollup(
+                start,
+                end,
+                nodes=[n.name for n in nodes],
+                metrics=metrics,
+                tier=resolution,
+            )
+            store.close()
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to query stats database: {err}")
+            results.ok = False
+            return results
+
+        series = {n.name: {} for n in nodes}
+        for t, name, typ, metric, count, avg, vmin, vmax in rows:
+            series[name].setdefault(f"{typ}:{metric}", []).append([t, avg, vmin, vmax])
+
+        for node in nodes:
+            results.set_node_data(
+                node, True, {"resolution": tier, "series": series[node.name]}
+            )
+
+        return results
+
+    # Return the latest value of each metric of the given nodes from the stats
+    # database.  For each node, the result data maps "<type>:<metric>" to a
+    # list of the time and value.
+    def stats_latest(self, nodes):
+        results = cmdresult.CmdResult()
+
+        store = self._open_statsdb(results)
+        if not store:
+            return results
+
+        try:
+            latest = store.latest(nodes=[n.name for n in nodes])
+            store.close()
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to query stats database: {err}")
+            results.ok = False
+            return results
+
+        values = {n.name: {} for n in nodes}
+        for (name, typ, metric), (t, val) in latest.items():
+            values[name][f"{typ}:{metric}"] = [t, val]
+
+        for node in nodes:
+            results.set_node_data(node, True, values[node.name])
+
+        return results
+
+    # Open the stats database, or report an error in the given results and
+    # return None if that's not possible.
+    def _open_statsdb(self, results):
+        if not os.path.exists(self.config.statsdb):
+            self.ui.error(f"no statistics available in {self.config.statsdb}")
+            results.ok = False
+            return None
+
+        try:
+            return statsdb.StatsStore(self.config.statsdb)
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to open stats database: {err}")
+            results.ok = False
+            return None
+
     def print_id(self, nodes, id):
         results = cmdresult.CmdResult()
         running = self._isrunning(nodes)
@@ -1343,7 +2002,7 @@ class Controller:
 
         return results
 
-    def install(self, local_only):
+    def install(self, local_only, full=False):
         results = cmdresult.CmdResult()
 
         try:
@@ -1396,6 +2055,10 @@ class Controller:
             results.ok = False
             return results
 
+        if not install.make_metrics_targets(self.ui):
+            results.ok = False
+            return results
+
         self.ui.info("generating local-networks.zeek ...")
         if not install.make_local_networks(
             self.config.policydirsiteinstallauto, self.ui
@@ -1478,7 +2141,7 @@ class Controller:
                 return results
 
         paths = [self.config.subst(dir) for (dir, mirror) in syncs if mirror]
-        if not execute.sync(nodes, paths, self.ui):
+        if not self._sync_trees(nodes, paths, full):
             results.ok = False
             return results
 
@@ -1487,66 +2150,198 @@ class Controller:
 
         return results
 
-    # Triggers all activity which is to be done regularly via cron.
-    def cron(self, watch):
-        if not self.config.cronenabled:
-            logging.debug("cron is disabled")
-            return
+    # Sync the given paths to the hosts of the given nodes.  Each path is
+    # described by a content manifest (see the manifest module), and the
+    # manifests last pushed to each host are kept in the state.  A path whose
+    # manifest did not change since it was last pushed to a host is skipped,
+    # and for a changed path only the changed files are copied and the removed
+    # ones deleted.  If "full" is true, or if a host has no manifest of a path
+    # yet, the whole path is mirrored.  The files are copied with rsync, or if
+    # InstallTransport is "archive", the changes of a path are sent as one
+    # archive through the existing connections to the hosts, unless the path
+    # is mirrored or the changed files exceed execute.ARCHIVE_MAXBYTES, in
+    # which case rsync mirrors it.  Returns True if all hosts were updated.
+    def _sync_trees(self, nodes, paths, full=False):
+        try:
+            store = manifest.ManifestStore(self.config.installmanifestdir)
+
+            # The manifests of the previous install serve as a cache of the
+            # file hashes.
+            cached = self.config.get_state("install-manifests-local") or {}
+            current = {}
+            for path in paths:
+                previous = store.load(cached.get(path))
+                m = manifest.build(path, previous)
+                current[path] = (store.save(m), m)
+        except (OSError, RuntimeEnvironmentError) as err:
+            self.ui.error(f"failed to build install manifests: {err}")
+            return False
+
+        self.config.set_state(
+            "install-manifests-local", {path: d for path, (d, _) in current.items()}
+        )
 
-        # Check if "zeekctl install" has been run.
-        if not self.config.is_zeekctl_installed():
-            # Don't output anything here, otherwise the cron job may generate
-            # emails before the user has a chance to do "zeekctl install".
-            return
+        relays = self._sync_relays(nodes)
+        archive = self.config.installtransport == "archive"
 
-        cronui = cron.CronUI()
-        tasks = cron.CronTasks(
-            cronui, self.config, self, self.executor, self.pluginregistry
-        )
+        jobs = []
+        removes = []
+        relayed = []
+        archives = []
+        for node in nodes:
+            pushed = {}
+            if not full:
+                pushed = self.config.get_state(f"install-manifests-{node.host}") or {}
+
+            mirror = []
+            files = []
+            removed = []
+            trees = []
+            for path, (d, m) in current.items():
+                if pushed.get(path) == d:
+                    continue
 
-        cronui.buffer_output()
+                old = store.load(pushed.get(path))
+                if old is None or node.host in relays:
+                    mirror.append(path)
+                    continue
+
+                changed, gone = manifest.diff(old, m)
+                if archive:
+                    if sum(m[n][1] for n in changed) > execute.ARCHIVE_MAXBYTES:
+                        mirror.append(path)
+                    else:
+                        trees.append((path, changed, gone))
+                    continue
+
+                files += [os.path.normpath(os.path.join(path, n)) for n in changed]
+                removed += [os.path.normpath(os.path.join(path, n)) for n in gone]
 
-        if watch:
-            # Check if node state matches expected state, and start/stop if
-            # necessary.
-            startlist = []
-            stoplist = []
-            for node, isrunning in self._isrunning(self.config.nodes()):
-                expectrunning = node.getExpectRunning()
+            if node.host in relays:
+                # The relay mirrors the changed paths to this host.
+                if mirror:
+                    relayed.append((relays[node.host], node, mirror))
+                continue
+
+            if removed:
+                removes.append((node, "rm", ["-rf", "--"] + removed))
+
+            if mirror or files or removed:
+                jobs.append((node, mirror, files))
+            if trees:
+                archives.append((node, trees))
+
+        ok = True
+        failed = set()
+        for node, success, output in self.executor.sync_archives(
+            archives, self.config.syncmaxjobs
+        ):
+            if not success:
+                self.ui.error(f"failed to update {node.host}: {output}")
+                failed.add(node.host)
+                ok = False
 
-                if not isrunning and expectrunning:
-                    startlist.append(node)
-                elif isrunning and not expectrunning:
-                    stoplist.append(node)
+        for node, success, output in self.executor.run_cmds(removes):
+            if not success:
+                self.ui.error(f"failed to remove old files on {node.host}: {output}")
+                failed.add(node.host)
+                ok = False
+
+        jobnodes = {node for node, _, _ in jobs} | {node for node, _ in archives}
+        jobs = [job for job in jobs if job[0].host not in failed]
+        rsynced = execute.sync_delta(jobs, self.ui, self.config.syncmaxjobs)
+        for node, _, _ in jobs:
+            if node not in rsynced:
+                failed.add(node.host)
+                ok = False
+
+        synced = {node for node in jobnodes if node.host not in failed}
+        for relay, node, _ in relayed:
+            if relay.host in failed:
+                self.ui.error(
+                    f"cannot update {node.host}: update of {relay.host} failed"
+                )
+                failed.add(node.host)
+                ok = False
 
-            if startlist:
-                self.start(startlist)
-            if stoplist:
-                self.stop(stoplist)
+        relayed = [job for job in relayed if job[1].host not in failed]
+        for node, success, output in self.executor.relay_sync(
+            relayed, self.config.syncmaxjobs
+        ):
+            jobnodes.add(node)
+            if success:
+                synced.add(node)
+            else:
+                self.ui.error(f"rsync to {node.addr} failed: {output}")
+                ok = False
+
+        uptodate = [n for n in nodes if n not in jobnodes and n.host not in failed]
+        if uptodate:
+            self.ui.info(f"{len(uptodate)} of {len(nodes)} hosts already up to date")
+
+        pushed = {path: d for path, (d, _) in current.items()}
+        for node in uptodate + list(synced):
+            self.config.set_state(f"install-manifests-{node.host}", pushed)
+
+        # Keep only the manifests that are still referenced.
+        keep = set()
+        for key, val in self.config.options():
+            if key.startswith("install-manifests-") and isinstance(val, dict):
+                keep.update(val.values())
+        store.prune(keep)
+
+        return ok
+
+    # Return a dict that maps the hosts of the given nodes (one per host) that
+    # receive install updates from another host instead of from the local
+    # host to the node of that host.  The hosts whose nodes have the same
+    # "sync_group" in node.cfg form a group, in which the first host receives
+    # the updates first and relays them to the other hosts.
+    def _sync_relays(self, nodes):
+        groups = {}
+        for node in self.config.nodes():
+            if node.sync_group and node.host not in groups:
+                groups[node.host] = node.sync_group
+
+        relays = {}
+        first = {}
+        for node in nodes:
+            group = groups.get(node.host)
+            if not group:
+                continue
 
-        # Check for dead hosts.
-        tasks.check_hosts()
+            if group in first:
+                relays[node.host] = first[group]
+            else:
+                first[group] = node
 
-        # Generate statistics.
-        tasks.log_stats(5)
+        return relays
 
-        # Check available disk space.
-        tasks.check_disk_space()
+    # Triggers all activity which is to be done regularly via cron.
+    # Run the given cron tasks (by default all of them, see cron.TASKS).  If
+    # "watch" is False, nodes are not restarted or stopped.  If an executor
+    # is given, it is used for the tasks instead of the controller's own.
+    def cron(self, watch, tasks=None, executor=None):
+        if not self.config.cronenabled:
+            logging.debug("cron is disabled")
+            return
 
-        # Expire old log files.
-        tasks.expire_logs()
+        # Check if "zeekctl install" has been run.
+        if not self.config.is_zeekctl_installed():
+            # Don't output anything here, otherwise the cron job may generate
+            # emails before the user has a chance to do "zeekctl install".
+            return
 
-        # Expire old crash directories.
-        tasks.expire_crash()
+        if tasks is None:
+            tasks = [name for name, _ in cron.TASKS]
 
-        # Update the HTTP stats directory.
-        tasks.update_http_stats()
+        if not watch:
+            tasks = [name for name in tasks if name != "watch_nodes"]
 
-        # Run external command if we have one.
-        tasks.run_cron_cmd()
+        outputs = self._run_cron_tasks(tasks, executor or self.executor)
 
         # Mail potential output.
-        output = cronui.get_buffered_output()
+        output = "".join(outputs)
         if output:
             success, out = self._sendmail("cron: " + output.splitlines()[0], output)
             if not success:
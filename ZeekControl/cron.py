@@ -1,11 +1,162 @@
 # Tasks which are to be done on a regular basis from cron.
+import fcntl
 import io
 import os
+import random
 import shutil
 import time
 
-from ZeekControl import execute
+from ZeekControl import execute, statsdb
 from ZeekControl import node as node_mod
+from ZeekControl.exceptions import RuntimeEnvironmentError
+
+
+# Parse the output of the netstats command for one node (e.g.,
+# "1365006359.859727 recvd=100 dropped=2 link=102") and return a tuple of
+# the number of packets received and dropped.  Raises ValueError if the
+# output cannot be parsed.
+def parse_netstats(output):
+    vals = {}
+    for field in output.split()[1:]:
+        key, _, val = field.partition("=")
+        vals[key] = int(val)
+
+    try:
+        return vals["recvd"], vals["dropped"]
+    except KeyError as err:
+        raise ValueError(f"missing field {err}")
+
+
+# Returns the percentage of packets dropped between two netstats samples
+# given as (received, dropped) tuples, or None if there were no packets or
+# the counters have been reset in between (e.g. because Zeek was restarted).
+def packet_loss(last, cur):
+    recvd = cur[0] - last[0]
+    dropped = cur[1] - last[1]
+
+    if recvd < 0 or dropped < 0 or recvd + dropped == 0:
+        return None
+
+    return 100.0 * dropped / (recvd + dropped)
+
+
+# Returns the rate of growth (in bytes per second) of a filesystem's usage,
+# fitted by least squares to a list of (time, used) samples, or None if the
+# samples do not span any time.
+def disk_growth_rate(history):
+    n = len(history)
+    if n < 2:
+        return None
+
+    meant = sum(t for t, _ in history) / n
+    meanu = sum(u for _, u in history) / n
+    var = sum((t - meant) ** 2 for t, _ in history)
+    if var == 0:
+        return None
+
+    return sum((t - meant) * (u - meanu) for t, u in history) / var
+
+
+# Returns the projected number of seconds until the space available on a
+# filesystem is used up, based on a list of (time, used) samples, or None if
+# its usage is not growing.  If archived logs on the filesystem expire after
+# 'retention' seconds (0 means never), the growth is expected to stop once
+# the logs written from now on start to expire, so None is also returned if
+# the space left can hold the growth over that period.
+def disk_time_to_full(history, avail, retention=0):
+    rate = disk_growth_rate(history)
+    if rate is None or rate <= 0:
+        return None
+
+    avail = max(avail, 0)
+    if retention > 0 and avail >= rate * retention:
+        return None
+
+    return avail / rate
+
+
+# The tasks of zeekctl cron in the order in which they are run, with the
+# default interval (in seconds) at which "zeekctl cron --daemon" runs each.
+TASKS = [
+    ("watch_nodes", 60),
+    ("check_hosts", 300),
+    ("check_capstats_collectors", 300),
+    ("log_stats", 300),
+    ("check_packet_loss", 300),
+    ("check_disk_space", 300),
+    ("summarize_messages", 300),
+    ("expire_logs", 3600),
+    ("expire_stats_db", 3600),
+    ("expire_crash", 3600),
+    ("update_http_stats", 300),
+    ("run_cron_cmd", 300),
+]
+
+# Tasks that can take a long time.  "zeekctl cron --daemon" runs these
+# separately, so that they don't delay the other tasks.
+SLOW_TASKS = {"expire_logs", "expire_stats_db", "expire_crash"}
+
+
+# Tasks that must have finished before a given task can start.
+TASK_DEPENDENCIES = {
+    # Collectors that were restarted should be used for the statistics.
+    "log_stats": ["check_capstats_collectors"],
+    # The stats.log file in spool is moved to StatsDir, in which the old
+    # entries of stats.log are expired.
+    "update_http_stats": ["log_stats", "expire_logs"],
+}
+
+
+# Return the names of the tasks among the given ones that must have finished
+# before the given task can start.  The nodes are started or stopped before
+# anything else is done, and the external cron command is run last.
+def task_dependencies(name, tasks):
+    if name == "run_cron_cmd":
+        deps = list(tasks)
+    else:
+        deps = TASK_DEPENDENCIES.get(name, []) + ["watch_nodes"]
+
+    return [dep for dep in deps if dep in tasks and dep != name]
+
+
+# Decides when each task of "zeekctl cron --daemon" is due.  Each task is
+# scheduled at its own interval, with a random jitter of up to the given
+# percentage of the interval so that tasks (and the cron daemons of several
+# clusters) don't all run at the same time.
+class CronScheduler:
+    def __init__(self, intervals, jitter, now=None, rand=random.random):
+        self.intervals = intervals
+        self.jitter = jitter / 100.0
+        self.rand = rand
+
+        if now is None:
+            now = time.time()
+
+        # All tasks are run soon after startup.
+        self.nextrun = {}
+        for name, interval in intervals.items():
+            self.nextrun[name] = now + interval * self.jitter * self.rand()
+
+    # Return the names of the tasks that are due at the given time (in the
+    # order of TASKS), and schedule their next run.
+    def due(self, now):
+        names = []
+
+        for name, _ in TASKS:
+            if name not in self.nextrun or self.nextrun[name] > now:
+                continue
+
+            names.append(name)
+
+            interval = self.intervals[name]
+            offset = interval * self.jitter * (2 * self.rand() - 1)
+            self.nextrun[name] = now + interval + offset
+
+        return names
+
+    # Return the time at which the next task is due.
+    def next_due(self):
+        return min(self.nextrun.values())
 
 
 class CronUI:
@@ -39,7 +190,29 @@ class CronTasks:
         self.executor = executor
         self.pluginregistry = pluginregistry
 
-    def log_stats(self, interval):
+    # Run the task with the given name.
+    def run(self, name):
+        getattr(self, name)()
+
+    # Check if node state matches expected state, and start/stop if
+    # necessary.
+    def watch_nodes(self):
+        startlist = []
+        stoplist = []
+        for node, isrunning in self.controller._isrunning(self.config.nodes()):
+            expectrunning = node.getExpectRunning()
+
+            if not isrunning and expectrunning:
+                startlist.append(node)
+            elif isrunning and not expectrunning:
+                stoplist.append(node)
+
+        if startlist:
+            self.controller.start(startlist)
+        if stoplist:
+            self.controller.stop(stoplist)
+
+    def log_stats(self, interval=5):
         if not self.config.statslogenable:
             return
 
@@ -48,58 +221,171 @@ class CronTasks:
 
         have_capstats = self.config.capstatspath
         capstats = []
+        samples = []
 
         if have_capstats:
-            capstats = self.controller.get_capstats_output(nodes, interval)
+            if self.config.capstatscollector:
+                samples = self._get_capstats_samples(nodes)
+            else:
+                capstats = self.controller.get_capstats_output(nodes, interval)
 
         t = time.time()
+        entries = []
 
-        try:
-            with open(self.config.statslog, "a") as out:
-                for node, error, vals in top:
-                    if not error:
-                        for val, key in sorted(vals.items()):
-                            out.write(f"{t} {node} parent {val} {key}\n")
-                    else:
-                        out.write(f"{t} {node} error error {error}\n")
-
-                for node, netif, success, vals in capstats:
-                    if not success:
-                        out.write(f"{t} {node} error error {vals}\n")
+        for node, error, vals in top:
+            if not error:
+                for key, val in sorted(vals.items()):
+                    if key == "threadgroups":
                         continue
+                    entries.append((t, node, "parent", key, val))
 
-                    for key, val in sorted(vals.items()):
-                        out.write(f"{t} {node} interface {key} {val}\n")
+                # Per-thread values are logged as "<group>:<key>".
+                threadgroups = vals.get("threadgroups", {})
+                for name, tvals in sorted(threadgroups.items()):
+                    for key, val in sorted(tvals.items()):
+                        entries.append((t, node, "thread", f"{name}:{key}", val))
+            else:
+                entries.append((t, node, "error", "error", error))
 
-                        if key == "pkts" and str(node) != "$total":
-                            # Report if we don't see packets on an interface.
-                            tag = f"lastpkts-{node.name}"
+        for node, netif, success, vals in capstats:
+            if not success:
+                entries.append((t, node, "error", "error", vals))
+                continue
 
-                            last = self.config.get_state(tag, default=-1.0)
+            for key, val in sorted(vals.items()):
+                entries.append((t, node, "interface", key, val))
 
-                            if self.config.mailreceivingpackets:
-                                if val == 0.0 and last != 0.0:
-                                    self.ui.info(
-                                        f"{node.host} is not seeing any packets on interface {netif}"
-                                    )
+                if key == "pkts" and str(node) != "$total":
+                    self._check_receiving_packets(node, netif, val)
 
-                                if val != 0.0 and last == 0.0:
-                                    self.ui.info(
-                                        f"{node.host} is seeing packets again on interface {netif}"
-                                    )
+        if samples:
+            self._log_capstats_samples(entries, t, samples)
 
-                            self.config.set_state(tag, val)
+        self._write_stats(entries)
 
+    # Append the given (time, node, type, key, value) entries to the stats.log
+    # file and add them to the stats database.
+    def _write_stats(self, entries):
+        try:
+            with open(self.config.statslog, "a") as out:
+                for t, node, kind, key, val in entries:
+                    out.write(f"{t} {node} {kind} {key} {val}\n")
         except OSError as err:
             self.ui.error(f"failed to append to file: {err}")
             return
 
+        try:
+            store = statsdb.StatsStore(self.config.statsdb)
+            store.add(entries)
+            store.close()
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to update stats database: {err}")
+
+    # Read the capstats samples taken by the collectors since the last time
+    # this was done.  The first time, only the latest sample is used.
+    def _get_capstats_samples(self, nodes):
+        since = {}
+        for node in nodes:
+            last = self.config.get_state(f"capstats-last-{node.name}")
+            if last is not None:
+                since[node.name] = last
+
+        results = []
+        capstats = self.controller.get_capstats_samples(nodes, since=since)
+        for node, netif, success, samples in capstats:
+            if success and node.name not in since:
+                samples = samples[-1:]
+            results += [(node, netif, success, samples)]
+
+        return results
+
+    # Add each capstats sample to the stats entries (with the time it was
+    # taken), and the sum of the latest samples as the "$total" pseudo-node.
+    def _log_capstats_samples(self, entries, t, samples):
+        totals = {}
+        latest = 0
+
+        for node, netif, success, nodesamples in samples:
+            if not success:
+                entries.append((t, node, "error", "error", nodesamples))
+                continue
+
+            if not nodesamples:
+                continue
+
+            for st, vals in nodesamples:
+                for key, val in sorted(vals.items()):
+                    entries.append((st, node, "interface", key, val))
+
+            st, vals = nodesamples[-1]
+            self.config.set_state(f"capstats-last-{node.name}", st)
+
+            if "pkts" in vals:
+                self._check_receiving_packets(node, netif, vals["pkts"])
+
+            latest += 1
+            for key, val in vals.items():
+                totals[key] = totals.get(key, 0.0) + val
+
+        if latest > 1:
+            for key, val in sorted(totals.items()):
+                entries.append((t, "$total", "interface", key, val))
+
+    # Report if we don't see packets on an interface.
+    def _check_receiving_packets(self, node, netif, pkts):
+        tag = f"lastpkts-{node.name}"
+
+        last = self.config.get_state(tag, default=-1.0)
+
+        if self.config.mailreceivingpackets:
+            if pkts == 0.0 and last != 0.0:
+                self.ui.info(
+                    f"{node.host} is not seeing any packets on interface {netif}"
+                )
+
+            if pkts != 0.0 and last == 0.0:
+                self.ui.info(
+                    f"{node.host} is seeing packets again on interface {netif}"
+                )
+
+        self.config.set_state(tag, pkts)
+
+    # Make sure that the capstats collectors of all nodes which are expected
+    # to be running are running, and stop those of all other nodes.
+    def check_capstats_collectors(self):
+        if not self.config.capstatscollector:
+            return
+
+        nodes = self.config.nodes()
+        running = [n for n in nodes if n.getExpectRunning()]
+
+        results = self.controller.start_capstats_collectors(running)
+        for node, netif, success, output in results:
+            if not success:
+                self.ui.error(
+                    f"failed to start capstats collector for {netif} on {node.host}: {output}"
+                )
+            elif output == "started":
+                self.ui.info(
+                    f"capstats collector for {netif} on {node.host} was not running, restarted"
+                )
+
+        self.controller.stop_capstats_collectors(
+            [n for n in nodes if not n.getExpectRunning()]
+        )
+
     def check_disk_space(self):
         minspace = self.config.mindiskspace
-        if minspace == 0:
+        horizon = self.config.diskfullhorizon * 3600
+        if minspace == 0 and horizon == 0:
             return
 
-        results = self.controller.df(self.config.hosts())
+        window = self.config.diskforecastwindow * 3600
+        retention = self.config.logexpireminutes * 60
+        now = time.time()
+
+        fsdirs = {}
+        results = self.controller.df(self.config.hosts(), fsdirs)
         for node, _, dfs in results.get_node_data():
             host = node.host
 
@@ -113,6 +399,16 @@ class CronTasks:
                 perc = df.percent
                 key = "disk-space-{}{}".format(host, fs.replace("/", "-"))
 
+                if horizon:
+                    # Only archived logs expire.
+                    logs = "logdir" in fsdirs.get((node.name, fs), ())
+                    self._check_disk_full(
+                        host, df, now, window, horizon, retention if logs else 0
+                    )
+
+                if minspace == 0:
+                    continue
+
                 if perc > 100 - minspace:
                     last = self.config.get_state(key, default=-1)
                     if last > 100 - minspace:
@@ -123,9 +419,119 @@ class CronTasks:
 
                 self.config.set_state(key, perc)
 
+    # Records the usage of a filesystem and warns if it is projected to become
+    # full within the horizon.  The usage history is kept in the state over a
+    # sliding window, and a projection is only made once the history spans
+    # at least half of the window.  The growth is assumed to stop after
+    # "retention" seconds (0 means never).
+    def _check_disk_full(self, host, df, now, window, horizon, retention):
+        fs = df.fs
+        key = "disk-history-{}{}".format(host, fs.replace("/", "-"))
+
+        history = self.config.get_state(key, default=[])
+        history = [(t, u) for t, u in history if now - window <= t < now]
+        history.append((now, df.used))
+        self.config.set_state(key, history)
+
+        if history[-1][0] - history[0][0] < window / 2:
+            return
+
+        ttf = disk_time_to_full(history, df.available, retention)
+
+        key = "disk-full-{}{}".format(host, fs.replace("/", "-"))
+        if ttf is not None and ttf < horizon:
+            if not self.config.get_state(key, default=False):
+                self.ui.warn(
+                    f"Disk on {host}:{fs} projected to be full in {ttf / 3600:.1f} hours - {df.percent:.1f}% used."
+                )
+            self.config.set_state(key, True)
+        else:
+            self.config.set_state(key, False)
+
+    def check_packet_loss(self):
+        threshold, nodethresholds = self.config.packet_loss_thresholds()
+        if threshold <= 0 and not any(t > 0 for t in nodethresholds.values()):
+            return
+
+        nodes = [
+            n
+            for n in self.config.nodes()
+            if (node_mod.is_worker(n) or node_mod.is_standalone(n))
+            and n.getExpectRunning()
+        ]
+        if not nodes:
+            return
+
+        intervals = max(self.config.packetlossintervals, 1)
+        alerts = []
+        recovered = []
+
+        results = self.controller.netstats(nodes)
+        for node, success, output in results.get_node_output():
+            if not success:
+                # The node is not running or can't be reached, which is
+                # reported elsewhere.
+                continue
+
+            try:
+                cur = parse_netstats(output)
+            except ValueError:
+                continue
+
+            key = f"netstats-{node.name}"
+            last = self.config.get_state(key)
+            self.config.set_state(key, list(cur))
+
+            if last is None:
+                continue
+
+            loss = packet_loss(last, cur)
+            if loss is None:
+                continue
+
+            # Nodes created via lb_procs can use the name of their node.cfg
+            # entry.
+            nodethreshold = nodethresholds.get(
+                node.name, nodethresholds.get(node.lbGroup(), threshold)
+            )
+
+            key = f"packetloss-count-{node.name}"
+            count = self.config.get_state(key, default=0)
+
+            if nodethreshold > 0 and loss > nodethreshold:
+                count += 1
+                if count == intervals:
+                    alerts.append(
+                        f"   {node.name}: {loss:.2f}% of packets dropped (threshold {nodethreshold}%) on {node.host}"
+                    )
+            else:
+                if count >= intervals:
+                    recovered.append(
+                        f"   {node.name}: {loss:.2f}% of packets dropped on {node.host}"
+                    )
+                count = 0
+
+            self.config.set_state(key, count)
+
+        # Report all nodes together so that there's just one mail.
+        if alerts:
+            self.ui.warn(
+                f"Packet loss above threshold for {intervals} consecutive intervals on {len(alerts)} node(s):"
+            )
+            for line in alerts:
+                self.ui.warn(line)
+
+        if recovered:
+            self.ui.info(
+                f"Packet loss back below threshold on {len(recovered)} node(s):"
+            )
+            for line in recovered:
+                self.ui.info(line)
+
     def expire_logs(self):
         if (
             self.config.logexpireminutes == 0
+            and self.config.logexpiresize == 0
             and self.config.statslogexpireinterval == 0
         ):
             return
@@ -152,6 +558,29 @@ class CronTasks:
                     if output:
                         self.ui.error(output)
 
+    # Remove the samples and rollups from the stats database that are older
+    # than configured for their tier.
+    def expire_stats_db(self):
+        if not os.path.exists(self.config.statsdb):
+            return
+
+        intervals = [
+            (0, self.config.statsdbrawexpireinterval),
+            (60, self.config.statsdbminuteexpireinterval),
+            (3600, self.config.statslogexpireinterval),
+        ]
+
+        now = time.time()
+
+        try:
+            store = statsdb.StatsStore(self.config.statsdb)
+            for tier, days in intervals:
+                if days:
+                    store.expire(now - 86400 * days, tier)
+            store.close()
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to expire stats database: {err}")
+
     def expire_crash(self):
         if self.config.crashexpireinterval == 0:
             return
@@ -180,11 +609,31 @@ class CronTasks:
 
             self.config.set_state(tag, alive)
 
+    # Count the new messages in the reporter.log and stderr.log files of the
+    # nodes, and report the ones that weren't seen before.
+    def summarize_messages(self):
+        if not self.config.messagesummary:
+            return
+
+        try:
+            new, skipped = self.controller.summarize_messages(self.config.nodes())
+        except RuntimeEnvironmentError as err:
+            self.ui.error(f"failed to update message database: {err}")
+            return
+
+        for node, filename, nbytes in skipped:
+            self.ui.warn(f"{node}: skipped {nbytes} bytes of {filename}")
+
+        if new and self.config.messagesummarymail:
+            self.ui.warn(f"{len(new)} new message(s) in reporter.log or stderr.log:")
+            for node, level, _, example in new:
+                self.ui.warn(f"   {node}: {level}: {example}")
+
     def update_http_stats(self):
         if not self.config.statslogenable:
             return
 
-        # Create meta file.
+        # Create the stats directory.
         if not os.path.exists(self.config.statsdir):
             try:
                 os.makedirs(self.config.statsdir)
@@ -196,6 +645,28 @@ class CronTasks:
 
             self.ui.info(f"creating directory for stats file: {self.config.statsdir}")
 
+        if self.config.statscsvenable and not self._update_www_dir():
+            return
+
+        # Append the current stats.log in spool to the one in ${statsdir}.
+        # The lock is shared with expire-statslog, which replaces that file.
+        dst = os.path.join(self.config.statsdir, os.path.basename(self.config.statslog))
+        try:
+            with open(dst + ".lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                with open(self.config.statslog) as fsrc:
+                    with open(dst, "a") as fdst:
+                        shutil.copyfileobj(fsrc, fdst)
+        except OSError as err:
+            self.ui.error(f"failed to append file: {err}")
+            return
+
+        os.unlink(self.config.statslog)
+
+    # Write the meta.dat file and update the CSV files in ${statsdir}/www
+    # from the current stats.log in spool.  Returns False if the meta.dat
+    # file or the www directory couldn't be created.
+    def _update_www_dir(self):
         metadat = os.path.join(self.config.statsdir, "meta.dat")
         try:
             with open(metadat, "w") as meta:
@@ -221,7 +692,7 @@ class CronTasks:
 
         except OSError as err:
             self.ui.error(f"failure creating file: {err}")
-            return
+            return False
 
         wwwdir = os.path.join(self.config.statsdir, "www")
         if not os.path.isdir(wwwdir):
@@ -229,7 +700,7 @@ class CronTasks:
                 os.makedirs(wwwdir)
             except OSError as err:
                 self.ui.error(f"failed to create directory: {err}")
-                return
+                return False
 
         # Update the WWW data
         statstocsv = os.path.join(self.config.scriptsdir, "stats-to-csv")
@@ -242,17 +713,7 @@ class CronTasks:
         else:
             self.ui.error(f"error reported by stats-to-csv\n{output}")
 
-        # Append the current stats.log in spool to the one in ${statsdir}
-        dst = os.path.join(self.config.statsdir, os.path.basename(self.config.statslog))
-        try:
-            with open(self.config.statslog) as fsrc:
-                with open(dst, "a") as fdst:
-                    shutil.copyfileobj(fsrc, fdst)
-        except OSError as err:
-            self.ui.error(f"failed to append file: {err}")
-            return
-
-        os.unlink(self.config.statslog)
+        return True
 
     def run_cron_cmd(self):
         # Run external command if we have one.
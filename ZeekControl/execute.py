@@ -1,11 +1,17 @@
 # These modules provides a set of functions to execute actions on a host.
 # If the host is local, it's done direcly; if it's remote we log in via SSH.
 
+import base64
+import io
+import json
 import logging
 import os
 import shutil
 import subprocess
+import tarfile
+from concurrent import futures
 
+from ZeekControl import fetch as fetch_mod
 from ZeekControl import ssh_runner, util
 
 
@@ -46,27 +52,78 @@ def install(src, dstdir, cmdout):
     return True
 
 
-# rsyncs paths from localhost to destination hosts.
-def sync(nodes, paths, cmdout):
-    result = True
+# The remote shell option of all rsyncs.
+RSYNC_RSH = '--rsh="ssh -o BatchMode=yes -o LogLevel=error -o ConnectTimeout=30"'
+
+# The maximum total size of the changed files of a path that the "archive"
+# install transport sends as an archive (see Executor.sync_archives).  An
+# archive travels as a single message through the connection to a host, and
+# is unpacked there in memory within the command timeout, so larger updates
+# and whole trees are copied with rsync instead.
+ARCHIVE_MAXBYTES = 16 * 1024 * 1024
+
+
+# Return the command line of an rsync that mirrors the given paths to the
+# host of the given node, deleting files that no longer exist.
+def mirror_cmdline(paths, node):
+    dst = f"{util.format_rsync_addr(node.addr)}:/"
+    return "rsync -rRl --delete {} {} {}".format(RSYNC_RSH, " ".join(paths), dst)
+
+
+# rsyncs a different set of paths from localhost to each destination host.
+# jobs:  a list of the form [ (node, paths, files), ... ]
+#   where "paths" are mirrored recursively (see mirror_cmdline), and
+#   "files" are copied individually (without the contents of directories).
+# maxjobs:  the maximum number of rsyncs to run at a time (zero means no
+#   limit).
+#
+# Returns the set of nodes for which all rsyncs succeeded.
+def sync_delta(jobs, cmdout, maxjobs=0):
     cmds = []
-    for n in nodes:
-        args = [
-            "-rRl",
-            "--delete",
-            '--rsh="ssh -o BatchMode=yes -o LogLevel=error -o ConnectTimeout=30"',
-        ]
-        dst = [f"{util.format_rsync_addr(n.addr)}:/"]
-        args += paths + dst
-        cmdline = "rsync {}".format(" ".join(args))
-        cmds += [(n, cmdline, "", None)]
-
-    for id, success, output in run_localcmds(cmds):
+    for n, paths, files in jobs:
+        dst = f"{util.format_rsync_addr(n.addr)}:/"
+        if paths:
+            cmdline = mirror_cmdline(paths, n)
+            cmds += [(n, cmdline, "", None)]
+        if files:
+            # The file names are read from stdin, relative to "/".
+            cmdline = f"rsync -lR --files-from=- {RSYNC_RSH} / {dst}"
+            cmds += [(n, cmdline, "", "".join(f"{f}\n" for f in files))]
+
+    ok = {n for n, _, _ in jobs}
+    for id, success, output in run_localcmds(cmds, maxjobs):
         if not success:
             cmdout.error(f"rsync to {id.addr} failed: {output}")
-            result = False
+            ok.discard(id)
+
+    return ok
+
+
+# Return the input for the unpack-archive helper that installs the given
+# file or directory "path" on another host: a line with the JSON list of the
+# "removed" names, followed by a gzip-compressed tar archive.  If "names" is
+# None, the archive contains all of "path", and otherwise only the given names
+# (relative to "path", without the contents of directories), where "." is
+# "path" itself.  Raises OSError if a file cannot be read.
+def make_archive(path, names=None, removed=()):
+    buf = io.BytesIO()
+    buf.write(json.dumps(list(removed)).encode() + b"\n")
+
+    base = os.path.basename(os.path.normpath(path))
+    with tarfile.open(fileobj=buf, mode="w:gz") as archive:
+        if names is None:
+            archive.add(path, arcname=base)
+        else:
+            for name in names:
+                # A path that is a single file has only the name ".".
+                src = path if name == "." else os.path.join(path, name)
+                archive.add(
+                    src,
+                    arcname=os.path.normpath(os.path.join(base, name)),
+                    recursive=False,
+                )
 
-    return result
+    return buf.getvalue()
 
 
 # Runs command locally and returns tuple (success, output)
@@ -82,12 +139,24 @@ def run_localcmd(cmd, env=None, inputtext=None):
 
 # Same as run_localcmd() but runs a set of local commands in parallel.
 # Cmds is a list of (id, cmd, envs, inputtext) tuples, where id is
-# an arbitrary cookie identifying each command.
+# an arbitrary cookie identifying each command.  At most "maxjobs" commands
+# run at a time (zero means no limit).
 # Returns a list of (id, success, output) tuples.
-def run_localcmds(cmds):
+def run_localcmds(cmds, maxjobs=0):
     results = []
     running = []
 
+    if 0 < maxjobs < len(cmds):
+        with futures.ThreadPoolExecutor(maxjobs) as pool:
+            for id, cmd, envs, inputtext in cmds:
+                running += [(id, pool.submit(run_localcmd, cmd, envs, inputtext))]
+
+            for id, future in running:
+                success, output = future.result()
+                results += [(id, success, output)]
+
+        return results
+
     for id, cmd, envs, inputtext in cmds:
         proc = _run_localcmd_init(id, cmd, envs)
         running += [(id, proc, inputtext)]
@@ -159,7 +228,8 @@ class Executor:
     # Run commands in parallel on one or more hosts.
     #
     # cmds:  a list of the form: [ (node, cmd, args), ... ]
-    #   where "cmd" is a string, "args" is a list of strings.
+    #   where "cmd" is a string, "args" is a list of strings.  A tuple can
+    #   have a fourth element with bytes to send to the command's stdin.
     # shell:  if True, then the "cmd" (and "args") will be interpreted by a
     #   shell.
     # helper:  if True, then the "cmd" will be modified to specify the full
@@ -188,7 +258,7 @@ class Executor:
 
         nodecmdlist = []
         for host in hostlist:
-            for zeeknode, cmd, args in dd[host]:
+            for zeeknode, cmd, args, *inputdata in dd[host]:
                 if helper:
                     cmdargs = [os.path.join(self.config.helperdir, cmd)]
                 else:
@@ -200,9 +270,14 @@ class Executor:
                 else:
                     cmdargs += args
 
-                nodecmdlist.append((zeeknode.addr, cmdargs))
                 logging.debug("%s: %s", zeeknode.host, " ".join(cmdargs))
 
+                if inputdata:
+                    data = base64.b64encode(inputdata[0]).decode()
+                    cmdargs = {"cmd": cmdargs, "input": data}
+
+                nodecmdlist.append((zeeknode.addr, cmdargs))
+
         for host, result in self.sshrunner.exec_multihost_commands(
             nodecmdlist, shell, self.config.commandtimeout
         ):
@@ -270,5 +345,153 @@ class Executor:
 
         return results
 
+    # Copy files or directories from one or more hosts in parallel (see the
+    # fetch module), in rounds of at most "chunksize" bytes per node.
+    # files:  a list of the form [ (node, path, destdir), ... ]
+    #   where "path" is a file or directory on the host of the node, which is
+    #   copied into the local directory "destdir".  There must be at most one
+    #   entry per node.
+    #
+    # Returns a list of the form: [ (node, success, output), ... ]
+    #   where "success" is a boolean (true if all files were copied), and
+    #   "output" is a string with a summary of the transfer and its errors.
+    def fetch(self, files, chunksize):
+        results = []
+        fetches = {}
+
+        cmds = [(node, "list-files", [path]) for node, path, _ in files]
+        dests = {node.name: (path, destdir) for node, path, destdir in files}
+
+        for node, success, output in self.run_helper(cmds):
+            path, destdir = dests[node.name]
+            try:
+                if not success:
+                    raise ValueError(output.strip())
+                listing = fetch_mod.parse_listing(output)
+            except ValueError as err:
+                results.append((node, False, f"cannot list {path}: {err}"))
+                continue
+
+            if listing is None:
+                results.append((node, False, f"{path} does not exist"))
+                continue
+
+            srcdir = os.path.dirname(os.path.normpath(path))
+            fetches[node.name] = (
+                node,
+                fetch_mod.NodeFetch(srcdir, destdir, listing, chunksize),
+            )
+
+        active = [nf for nf in fetches.values() if not nf[1].done()]
+        while active:
+            cmds = [(node, "read-chunks", nf.args()) for node, nf in active]
+
+            for node, success, output in self.run_helper(cmds):
+                nf = fetches[node.name][1]
+                try:
+                    if not success:
+                        raise ValueError(output.strip())
+                    nf.feed(output)
+                except (ValueError, OSError) as err:
+                    nf.errors.append(str(err))
+                    nf.pending = []
+
+            active = [(node, nf) for node, nf in active if not nf.done()]
+
+        for node, nf in fetches.values():
+            received = util.number_unit_str(nf.received).strip()
+            transferred = util.number_unit_str(nf.transferred).strip()
+            summary = (
+                f"{nf.fetched} files fetched ({received}, {transferred} transferred)"
+            )
+            if nf.resumed:
+                summary += f", {nf.resumed} resumed"
+            if nf.skipped:
+                summary += f", {nf.skipped} up to date"
+
+            results.append((node, not nf.errors, "\n".join([summary] + nf.errors)))
+
+        return results
+
+    # rsyncs paths from relay hosts (which already have the current version of
+    # the paths) to other hosts, so that these don't need to be updated from
+    # the local host.
+    # jobs:  a list of the form [ (relay, node, paths), ... ]
+    #   where "paths" are mirrored from the host of the node "relay" to the
+    #   host of "node".
+    # maxjobs:  the maximum number of rsyncs that each relay runs at a time
+    #   (zero means no limit).
+    #
+    # Returns a list of the form: [ (node, success, output), ... ]
+    def relay_sync(self, jobs, maxjobs=0):
+        results = []
+        pending = {}
+        for relay, node, paths in jobs:
+            pending.setdefault(relay.host, []).append((relay, node, paths))
+
+        while pending:
+            cmds = []
+            # The destinations of each relay's rsyncs, in the order of the
+            # results.
+            dests = {}
+            for host in list(pending):
+                batch = pending[host][:maxjobs] if maxjobs > 0 else pending[host]
+                pending[host] = pending[host][len(batch) :]
+                if not pending[host]:
+                    del pending[host]
+
+                for relay, node, paths in batch:
+                    cmds.append((relay, mirror_cmdline(paths, node), []))
+                    dests.setdefault(relay.name, []).append(node)
+
+            for relay, success, output in self.run_cmds(cmds, shell=True):
+                node = dests[relay.name].pop(0)
+                results.append((node, success, output))
+
+        return results
+
+    # Install files and directories on one or more hosts by sending archives
+    # through the existing connections to the hosts (see make_archive), which
+    # the unpack-archive helper unpacks into a staging directory and then
+    # moves into place.
+    # jobs:  a list of the form [ (node, trees), ... ]
+    #   where "trees" is a list of (path, names, removed) tuples, with
+    #   "names" and "removed" like for make_archive.
+    # maxjobs:  the maximum number of hosts to send archives to at a time
+    #   (zero means no limit).
+    #
+    # Returns a list of the form: [ (node, success, output), ... ]
+    #   with one entry per tree (a tree whose archive cannot be built is
+    #   reported as failed for each node without being sent).
+    def sync_archives(self, jobs, maxjobs=0):
+        results = []
+        # Hosts often need the same archive, so each one is built only once.
+        archives = {}
+
+        while jobs:
+            batch = jobs[:maxjobs] if maxjobs > 0 else jobs
+            jobs = jobs[len(batch) :]
+
+            cmds = []
+            for node, trees in batch:
+                for path, names, removed in trees:
+                    key = (path, tuple(names or ()), names is None, tuple(removed))
+                    if key not in archives:
+                        try:
+                            archives[key] = make_archive(path, names, removed)
+                        except OSError as err:
+                            archives[key] = f"cannot create archive of {path}: {err}"
+
+                    if isinstance(archives[key], str):
+                        results.append((node, False, archives[key]))
+                        continue
+
+                    mode = "full" if names is None else "delta"
+                    cmds.append((node, "unpack-archive", [path, mode], archives[key]))
+
+            results += self.run_helper(cmds)
+
+        return results
+
     def host_status(self):
         return self.sshrunner.host_status()
@@ -0,0 +1,177 @@
+# Copying files from the nodes for the fetch command.
+#
+# The files are first listed with the list-files helper and then read in
+# rounds with the read-chunks helper, through the same per-host connections
+# as all other commands.  Each round reads at most a fixed number of bytes per
+# node (spread over as many small files as fit), which the helper compresses
+# before sending.  The data is appended to a local "<file>.part" file as it
+# arrives, which is renamed once complete.  The modification time of the
+# ".part" file is set to that of the remote file, so that an interrupted fetch
+# resumes where it left off if the remote file did not change in between.
+
+import base64
+import binascii
+import os
+import zlib
+
+# The suffix of files that are not yet completely fetched.
+PARTSUFFIX = ".part"
+
+# The maximum number of files read in one round.
+MAXFILES = 100
+
+
+# Parse the output of the list-files helper, and return a list of (size,
+# mtime, name) tuples, or None if the path does not exist.  Raises ValueError
+# if the output cannot be parsed.
+def parse_listing(output):
+    if output.strip() == "-":
+        return None
+
+    files = []
+    for line in output.splitlines():
+        try:
+            size, mtime, name = line.split(" ", 2)
+            size, mtime = int(size), int(mtime)
+        except ValueError:
+            raise ValueError(f"unexpected output of list-files: {line}")
+
+        name = os.path.normpath(name)
+        if os.path.isabs(name) or name.split(os.sep)[0] == "..":
+            raise ValueError(f"invalid file name from list-files: {name}")
+
+        files.append((size, mtime, name))
+
+    return files
+
+
+class RemoteFile:
+    def __init__(self, path, size, mtime, dest):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.dest = dest
+        self.offset = 0
+        self.done = False
+
+
+class NodeFetch:
+    # Fetch the files of a listing (see parse_listing) below "srcdir" on a
+    # node to the same names below "destdir", in chunks of at most
+    # "chunksize" bytes.  Files which already exist locally with the same
+    # size and modification time are skipped.
+    def __init__(self, srcdir, destdir, files, chunksize):
+        self.chunksize = chunksize
+        self.pending = []
+        self.requested = []
+        self.errors = []
+        self.fetched = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.received = 0
+        self.transferred = 0
+
+        for size, mtime, name in files:
+            f = RemoteFile(
+                os.path.join(srcdir, name), size, mtime, os.path.join(destdir, name)
+            )
+
+            if self._uptodate(f.dest, f):
+                self.skipped += 1
+                continue
+
+            if self._uptodate(f.dest + PARTSUFFIX, f, partial=True):
+                f.offset = os.path.getsize(f.dest + PARTSUFFIX)
+                self.resumed += 1
+
+            self.pending.append(f)
+
+    @staticmethod
+    def _uptodate(path, f, partial=False):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        if int(st.st_mtime) != f.mtime:
+            return False
+
+        return st.st_size <= f.size if partial else st.st_size == f.size
+
+    def done(self):
+        return not self.pending
+
+    # Return the arguments of the read-chunks helper for the next round.
+    def args(self):
+        args = []
+        budget = self.chunksize
+        self.requested = []
+
+        for f in self.pending[:MAXFILES]:
+            count = min(f.size - f.offset, budget)
+            args += [f.path, str(f.offset), str(count)]
+            self.requested.append((f, count))
+            budget -= count
+            if budget <= 0:
+                break
+
+        return args
+
+    # Process the output of the read-chunks helper for the files requested
+    # by the previous call of args(), and write the data to the local files.
+    # Files that vanished or shrank on the node in the meantime are skipped,
+    # and the error is recorded in "errors".  Raises ValueError if the output
+    # cannot be parsed, and OSError if a local file cannot be written.
+    def feed(self, output):
+        lines = output.splitlines()
+
+        for f, requested in self.requested:
+            if not lines:
+                raise ValueError("missing output of read-chunks")
+
+            header = lines.pop(0)
+            if header.strip() == "-":
+                self._fail(f, "file vanished")
+                continue
+
+            try:
+                size, _, count = (int(v) for v in header.split())
+                encoded = lines.pop(0)
+                data = zlib.decompress(base64.b64decode(encoded))
+            except (ValueError, IndexError, binascii.Error, zlib.error):
+                raise ValueError(f"unexpected output of read-chunks: {header}")
+
+            if len(data) != count:
+                raise ValueError(f"corrupt chunk of {f.path}")
+
+            if size < f.size or count < requested:
+                self._fail(f, "file shrank while fetching")
+                continue
+
+            self._write(f, data)
+            self.received += count
+            self.transferred += len(encoded)
+
+            if f.offset >= f.size:
+                os.rename(f.dest + PARTSUFFIX, f.dest)
+                f.done = True
+                self.fetched += 1
+
+        self.requested = []
+        self.pending = [f for f in self.pending if not f.done]
+
+    def _write(self, f, data):
+        part = f.dest + PARTSUFFIX
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+
+        with open(part, "r+b" if f.offset else "wb") as out:
+            out.seek(f.offset)
+            out.write(data)
+            out.truncate()
+
+        f.offset += len(data)
+        os.utime(part, (f.mtime, f.mtime))
+
+    def _fail(self, f, reason):
+        self.errors.append(f"{f.path}: {reason}")
+        f.done = True
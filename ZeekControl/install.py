@@ -1,6 +1,7 @@
 # Functions to install files on all nodes.
 
 import binascii
+import json
 import os
 
 from ZeekControl import config, util
@@ -146,9 +147,11 @@ def make_zeekctl_config_sh(cmdout):
 # Create Zeek-side zeekctl configuration file.
 def make_layout(path, cmdout, silent=False):
     class Port:
-        def __init__(self, startport):
+        def __init__(self, startport, setter):
             # This is the first port number to use.
             self.p = startport
+            # Name of the node method that records the port number.
+            self.setter = setter
 
         # Record the port number that the specified node will use (if node is
         # None, then don't record it) and return that port number.
@@ -158,15 +161,15 @@ def make_layout(path, cmdout, silent=False):
             self.p += 1
 
             if node is not None:
-                node.setPort(port)
+                getattr(node, self.setter)(port)
 
             return port
 
     manager = config.Config.manager()
-    zeekport = Port(config.Config.zeekport)
+    zeekport = Port(config.Config.zeekport, "setPort")
     metricsport = None
     if config.Config.metricsport != 0:
-        metricsport = Port(config.Config.metricsport)
+        metricsport = Port(config.Config.metricsport, "setMetricsPort")
 
     if config.Config.standalone:
         if not silent:
@@ -180,9 +183,7 @@ def make_layout(path, cmdout, silent=False):
         ostr += f"redef Broker::default_port = {zeekport.use_port(manager)}/tcp;\n"
         if metricsport:
             ostr += '@if ( getenv("ZEEKCTL_DISABLE_LISTEN") == "" )\n'
-            ostr += (
-                f"redef Telemetry::metrics_port = {metricsport.use_port(None)}/tcp;\n"
-            )
+            ostr += f"redef Telemetry::metrics_port = {metricsport.use_port(manager)}/tcp;\n"
             ostr += "@endif\n"
         ostr += "\n"
         ostr += "event zeek_init()\n"
@@ -214,21 +215,21 @@ def make_layout(path, cmdout, silent=False):
         # set in zeekctl.cfg will be the one used for the manager.
         ostr += f'\t["{manager.name}"] = [$node_type=Cluster::MANAGER, $ip={util.format_zeek_addr(manager.addr)}, $p={zeekport.use_port(manager)}/tcp'
         if metricsport:
-            ostr += f", $metrics_port={metricsport.use_port(None)}/tcp"
+            ostr += f", $metrics_port={metricsport.use_port(manager)}/tcp"
         ostr += "],\n"
 
         # Loggers definition
         for lognode in loggers:
             ostr += f'\t["{lognode.name}"] = [$node_type=Cluster::LOGGER, $ip={util.format_zeek_addr(lognode.addr)}, $p={zeekport.use_port(lognode)}/tcp'
             if metricsport:
-                ostr += f", $metrics_port={metricsport.use_port(None)}/tcp"
+                ostr += f", $metrics_port={metricsport.use_port(lognode)}/tcp"
             ostr += "],\n"
 
         # Proxies definition (all proxies use same logger as the manager)
         for p in proxies:
             ostr += f'\t["{p.name}"] = [$node_type=Cluster::PROXY, $ip={util.format_zeek_addr(p.addr)}, $p={zeekport.use_port(p)}/tcp, $manager="{manager.name}"'
             if metricsport:
-                ostr += f", $metrics_port={metricsport.use_port(None)}/tcp"
+                ostr += f", $metrics_port={metricsport.use_port(p)}/tcp"
             ostr += "],\n"
 
         # Workers definition
@@ -236,7 +237,7 @@ def make_layout(path, cmdout, silent=False):
             p = w.count % len(proxies)
             ostr += f'\t["{w.name}"] = [$node_type=Cluster::WORKER, $ip={util.format_zeek_addr(w.addr)}, $p={zeekport.use_port(w)}/tcp, $manager="{manager.name}"'
             if metricsport:
-                ostr += f", $metrics_port={metricsport.use_port(None)}/tcp"
+                ostr += f", $metrics_port={metricsport.use_port(w)}/tcp"
             ostr += "],\n"
 
         # Activate time-machine support if configured.
@@ -266,6 +267,54 @@ def make_layout(path, cmdout, silent=False):
     return True
 
 
+# Write a Prometheus file-based service discovery file listing the metrics
+# endpoint of each node (the ports are the ones assigned by make_layout).
+def make_metrics_targets(cmdout):
+    sd_path = config.Config.metricstargetsfile
+    if not sd_path or config.Config.metricsport == 0:
+        return True
+
+    targets = []
+    for n in config.Config.nodes():
+        port = n.getMetricsPort()
+        if port < 0:
+            continue
+
+        targets.append(
+            {
+                "targets": [f"{util.format_zeek_addr(n.addr)}:{port}"],
+                "labels": {
+                    "node": n.name,
+                    "type": n.type,
+                    "host": n.host,
+                    "lb_group": n.lbGroup(),
+                },
+            }
+        )
+
+    # Write a tmp file first and then rename it, so that Prometheus never
+    # reads a partially written file.
+    tmp_path = os.path.join(
+        os.path.dirname(sd_path), f".{os.path.basename(sd_path)}.tmp"
+    )
+
+    try:
+        with open(tmp_path, "w") as out:
+            json.dump(targets, out, indent=2)
+            out.write("\n")
+    except OSError as e:
+        cmdout.error(f"failed to write file: {e}")
+        return False
+
+    try:
+        os.rename(tmp_path, sd_path)
+    except OSError as e:
+        cmdout.error(f"failed to rename file {tmp_path}: {e}")
+        return False
+
+    return True
+
+
 # Reads in a list of networks from file.
 def read_networks(fname):
     nets = []
@@ -0,0 +1,158 @@
+# Content manifests of the directories that the install command syncs to the
+# remote hosts.
+#
+# A manifest maps the name of each file, symlink, and directory in a tree
+# (relative to the tree, with "." being the tree itself) to a list [kind,
+# size, hash, mtime], where kind is "f", "l", or "d", and hash is the SHA-1 of
+# the contents of a file or the target of a symlink.  The modification time
+# is only used to avoid rehashing unchanged files, and is not part of the
+# digest that identifies a manifest, so that regenerating a file with the
+# same contents does not change the digest.
+
+import hashlib
+import json
+import os
+
+from ZeekControl.exceptions import RuntimeEnvironmentError
+
+
+def _hash_file(path):
+    hh = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hh.update(block)
+    return hh.hexdigest()
+
+
+def _entry(path, previous):
+    st = os.lstat(path)
+
+    if os.path.islink(path):
+        target = os.readlink(path)
+        return ["l", len(target), hashlib.sha1(target.encode()).hexdigest(), 0]
+
+    if os.path.isdir(path):
+        return ["d", 0, "", 0]
+
+    if (
+        previous
+        and previous[0] == "f"
+        and previous[1] == st.st_size
+        and previous[3] == st.st_mtime_ns
+    ):
+        return previous
+
+    return ["f", st.st_size, _hash_file(path), st.st_mtime_ns]
+
+
+# Return the manifest of the given file or directory.  The hashes of files
+# with the same size and modification time as in the "previous" manifest of
+# the same path are reused.  Raises OSError if the tree cannot be read.
+def build(path, previous=None):
+    previous = previous or {}
+    manifest = {".": _entry(path, previous.get("."))}
+
+    if manifest["."][0] != "d":
+        return manifest
+
+    for dirpath, dirnames, filenames in os.walk(path):
+        # Symlinks to directories are listed as symlinks, not followed.
+        for name in sorted(dirnames) + sorted(filenames):
+            fullname = os.path.join(dirpath, name)
+            relname = os.path.relpath(fullname, path)
+            manifest[relname] = _entry(fullname, previous.get(relname))
+
+    return manifest
+
+
+# Return the digest that identifies the contents of a manifest.
+def digest(manifest):
+    hh = hashlib.sha1()
+    for name in sorted(manifest):
+        kind, size, hash, _ = manifest[name]
+        hh.update(f"{name}\0{kind}\0{size}\0{hash}\n".encode())
+    return hh.hexdigest()
+
+
+# Compare two manifests of a tree, and return a tuple (changed, removed) of
+# sorted lists of the names that are new or changed in the "new" manifest,
+# and of the names that need to be removed first.  An entry that changed its
+# kind (e.g., a file that became a directory) is in both lists.
+def diff(old, new):
+    changed = []
+    removed = []
+
+    for name, entry in new.items():
+        prev = old.get(name)
+        if prev is None:
+            changed.append(name)
+        elif prev[0] != entry[0]:
+            removed.append(name)
+            changed.append(name)
+        elif prev[:3] != entry[:3]:
+            changed.append(name)
+
+    for name in old:
+        if name not in new:
+            removed.append(name)
+
+    # Don't remove the contents of directories that are removed anyway.
+    removed.sort()
+    pruned = []
+    for name in removed:
+        if not pruned or not name.startswith(pruned[-1] + os.sep):
+            pruned.append(name)
+
+    return sorted(changed), pruned
+
+
+class ManifestStore:
+    """Directory storing manifests by their digest."""
+
+    def __init__(self, path):
+        self.path = path
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError as err:
+            raise RuntimeEnvironmentError(
+                f"cannot create manifest directory {self.path}: {err}"
+            )
+
+    def _filename(self, digest):
+        return os.path.join(self.path, f"{digest}.json")
+
+    # Return the manifest with the given digest, or None if it is not stored.
+    def load(self, digest):
+        if not digest:
+            return None
+
+        try:
+            with open(self._filename(digest)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Store a manifest, and return its digest.
+    def save(self, manifest):
+        d = digest(manifest)
+        filename = self._filename(d)
+        tmpname = filename + ".tmp"
+
+        try:
+            with open(tmpname, "w") as f:
+                json.dump(manifest, f)
+            os.rename(tmpname, filename)
+        except OSError as err:
+            raise RuntimeEnvironmentError(f"cannot store manifest {filename}: {err}")
+
+        return d
+
+    # Remove all manifests except those with the given digests.
+    def prune(self, keep):
+        for name in os.listdir(self.path):
+            if name.endswith(".json") and name[:-5] not in keep:
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except OSError:
+                    pass
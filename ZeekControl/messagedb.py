@@ -0,0 +1,155 @@
+import os
+import sqlite3
+
+from ZeekControl.exceptions import RuntimeEnvironmentError
+
+
+class MessageStore:
+    """Store for the distinct messages in the reporter.log and stderr.log
+    files of the nodes.
+
+    Messages are grouped by their template (the message with the variable
+    parts replaced by placeholders, see the summarize-messages helper) and
+    level.  For each template, the store keeps an example, the times when it
+    was first and last seen, and the number of occurrences per node, so that
+    its size depends only on the number of distinct messages.  It also keeps
+    the position up to which each file of each node has been read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        try:
+            if path != ":memory:":
+                dirname = os.path.dirname(path)
+                if dirname and not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+
+            self.db = sqlite3.connect(self.path, timeout=60)
+        except (OSError, sqlite3.Error) as err:
+            raise RuntimeEnvironmentError(
+                f"{err}: {path}\nCheck if the user running ZeekControl has both write and search permission to\nthe directory containing the database file and has both read and write\npermission to the database file itself."
+            )
+
+        self.c = self.db.cursor()
+
+        try:
+            self.setup()
+        except sqlite3.Error as err:
+            raise RuntimeEnvironmentError(
+                f"{err}: {path}\nCheck if the user running ZeekControl has write access to the database file.\nOtherwise, the database file is possibly corrupt."
+            )
+
+    def setup(self):
+        self.c.execute("""CREATE TABLE IF NOT EXISTS templates (
+            id       INTEGER  PRIMARY KEY,
+            level    TEXT     NOT NULL,
+            template TEXT     NOT NULL,
+            example  TEXT     NOT NULL,
+            first    REAL     NOT NULL,
+            last     REAL     NOT NULL,
+            UNIQUE (level, template)
+        )""")
+
+        self.c.execute("""CREATE TABLE IF NOT EXISTS counts (
+            template INTEGER  NOT NULL,
+            node     TEXT     NOT NULL,
+            count    INTEGER  NOT NULL,
+            last     REAL     NOT NULL,
+            PRIMARY KEY (template, node)
+        )""")
+
+        self.c.execute("""CREATE TABLE IF NOT EXISTS offsets (
+            node     TEXT     NOT NULL,
+            file     TEXT     NOT NULL,
+            inode    INTEGER  NOT NULL,
+            offset   INTEGER  NOT NULL,
+            PRIMARY KEY (node, file)
+        )""")
+
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # Return the (inode, offset) up to which the given file of a node has
+    # been read, or (0, 0) if it hasn't been read yet.
+    def get_offset(self, node, file):
+        self.c.execute(
+            "SELECT inode, offset FROM offsets WHERE node = ? AND file = ?",
+            (node, file),
+        )
+        row = self.c.fetchone()
+        return tuple(row) if row else (0, 0)
+
+    # Add the (count, level, template, example) messages read from a file of
+    # a node at the given time, and record the position up to which the file
+    # has been read.  Returns the (level, template, example) of the templates
+    # that were not seen before.
+    def add(self, node, file, inode, offset, messages, t):
+        new = []
+
+        try:
+            for count, level, template, example in messages:
+                self.c.execute(
+                    """UPDATE templates SET example = ?, last = ?
+                       WHERE level = ? AND template = ?""",
+                    (example, t, level, template),
+                )
+                if self.c.rowcount == 0:
+                    self.c.execute(
+                        """INSERT INTO templates (level, template, example, first, last)
+                           VALUES (?,?,?,?,?)""",
+                        (level, template, example, t, t),
+                    )
+                    new.append((level, template, example))
+
+                self.c.execute(
+                    """INSERT INTO counts (template, node, count, last)
+                       SELECT id, ?, ?, ? FROM templates WHERE level = ? AND template = ?
+                       ON CONFLICT (template, node) DO UPDATE
+                       SET count = count + excluded.count, last = excluded.last""",
+                    (node, count, t, level, template),
+                )
+
+            self.c.execute(
+                """INSERT INTO offsets (node, file, inode, offset) VALUES (?,?,?,?)
+                   ON CONFLICT (node, file) DO UPDATE
+                   SET inode = excluded.inode, offset = excluded.offset""",
+                (node, file, inode, offset),
+            )
+        except sqlite3.Error as err:
+            self.db.rollback()
+            raise RuntimeEnvironmentError(
+                f"{err}: {self.path}\nCheck if the user running ZeekControl has write access to the database file."
+            )
+
+        self.db.commit()
+        return new
+
+    # Return the "top" most frequent templates as a list of (level, template,
+    # example, count, nodes, first, last) tuples, where "nodes" is the number
+    # of nodes on which the template was seen.  Only the counts of the given
+    # nodes (a list of names) are included, if given.
+    def top(self, top=10, nodes=None):
+        where = ""
+        args = []
+        if nodes is not None:
+            where = "WHERE c.node IN ({})".format(",".join("?" * len(nodes)))
+            args += nodes
+
+        self.c.execute(
+            f"""SELECT t.level, t.template, t.example, SUM(c.count),
+                       COUNT(c.node), t.first, MAX(c.last)
+                FROM counts c JOIN templates t ON t.id = c.template {where}
+                GROUP BY t.id ORDER BY SUM(c.count) DESC, t.template LIMIT ?""",
+            args + [top],
+        )
+        return self.c.fetchall()
+
+    # Remove all templates and counts, and restart from the current end of
+    # all files.
+    def reset(self):
+        self.c.execute("DELETE FROM counts")
+        self.c.execute("DELETE FROM templates")
+        self.db.commit()
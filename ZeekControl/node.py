@@ -82,6 +82,15 @@ class Node:
         ``aux_scripts`` (string)
             Any node-specific Zeek script configured for this node.
 
+        ``sync_group`` (string)
+            The name of a group of hosts (e.g., the hosts in the same rack)
+            that are updated by the install command from one of them instead
+            of each from the manager.  The first host of a group receives the
+            updates from the manager and then relays them to the other hosts
+            of the group with rsync, which requires that it can log in to
+            them via ssh without a password.  The number of rsyncs that run
+            at once is limited by SyncMaxJobs_.
+
         ``zone_id`` (string)
             If ZeekControl is managing a cluster comprised of nodes
             using non-global IPv6 addresses, then this configures the
@@ -116,6 +125,7 @@ class Node:
         "lb_interfaces": 1,
         "pin_cpus": 1,
         "env_vars": 1,
+        "sync_group": 1,
         "count": 1,
     }
 
@@ -192,6 +202,14 @@ class Node:
         """Returns a string with the node's working directory."""
         return os.path.join(self._config.spooldir, self.name)
 
+    def lbGroup(self):
+        """Returns the name of the node.cfg entry that the node was created
+        from.  Nodes created from one entry by ``lb_procs`` have a numerical
+        suffix appended to the name of that entry."""
+        if self.lb_procs:
+            return self.name.rsplit("-", 1)[0]
+        return self.name
+
     def setPID(self, pid):
         """Stores the process ID of the node's Zeek process."""
         key = f"{self.name}-pid"
@@ -258,6 +276,20 @@ class Node:
         key = f"{self.name}-port"
         return self._config.get_state(key) or -1
 
+    def setMetricsPort(self, port):
+        """Set the Prometheus telemetry port this node is using."""
+        key = f"{self.name}-metrics-port"
+        self._config.set_state(key, port)
+
+    @doc.api
+    def getMetricsPort(self):
+        """Returns an integer with the port number that this node's
+        Prometheus telemetry endpoint is listening on, or -1 if no such port
+        has been set yet.
+        """
+        key = f"{self.name}-metrics-port"
+        return self._config.get_state(key) or -1
+
     @staticmethod
     def addKey(kw):
         """Adds a supported node key. This is used by the PluginRegistry to
@@ -118,6 +118,14 @@ options = [
         False,
         "The TCP port number that Zeek will listen on for Prometheus telemetry. For a cluster configuration, each node in the cluster will automatically be assigned a subsequent port to listen on. Setting this to 0 will disable telemetry on all nodes.",
     ),
+    Option(
+        "MetricsTargetsFile",
+        "${SpoolDir}/metrics-targets.json",
+        "string",
+        Option.USER,
+        False,
+        "Path of the Prometheus file-based service discovery (file_sd) file that the install command writes. It lists each node's metrics endpoint labeled with the node name, type, host, and load-balancing group. Make this string blank to disable writing the file. This option is ignored if MetricsPort is 0.",
+    ),
     Option(
         "LogRotationInterval",
         3600,
@@ -166,6 +174,46 @@ options = [
         False,
         "If archived logs will be compressed, the command to use for that. The specified command must compress its standard input to standard output.",
     ),
+    Option(
+        "UseArchiver",
+        0,
+        "bool",
+        Option.USER,
+        False,
+        "True to let a resident archiver process on each host that writes logs archive (and compress) the rotated logs, instead of a separate archive-log process for each log.  This avoids a burst of processes when many logs are rotated at once.  The archiver writes its progress to the status file in spool/archiver.",
+    ),
+    Option(
+        "ArchiverThreads",
+        2,
+        "int",
+        Option.USER,
+        False,
+        "Maximum number of logs that the archiver (see the UseArchiver option) archives at the same time.",
+    ),
+    Option(
+        "CompressCodec",
+        "",
+        "string",
+        Option.USER,
+        False,
+        "If archived logs will be compressed, the built-in codec to use instead of the CompressCmd option (empty string means use CompressCmd).  The codec can be gzip, or zstd or lz4 (if the zstandard or lz4 Python modules are installed).  The file extension is gz, zst, or lz4, respectively, and the CompressExtension option is ignored.  Large logs are compressed in blocks by several threads in parallel, and the result can be read with the standard tools.  The compress-log script (in the zeekctl scripts directory) has a --benchmark mode that reports the throughput and compression ratio of the codecs on given log files.",
+    ),
+    Option(
+        "CompressLevel",
+        6,
+        "int",
+        Option.USER,
+        False,
+        "Compression level of the codec specified by the CompressCodec option (1-9 for gzip, 1-22 for zstd, and 0-16 for lz4).",
+    ),
+    Option(
+        "CompressThreads",
+        4,
+        "int",
+        Option.USER,
+        False,
+        "Number of threads that compress each archived log with the codec specified by the CompressCodec option.",
+    ),
     Option(
         "CompressExtension",
         "gz",
@@ -270,6 +318,30 @@ options = [
         False,
         "True to enable sending mail when zeekctl cron notices that an interface is not receiving any packets (note that such mail is not sent when StatsLogEnable is 0).",
     ),
+    Option(
+        "PacketLossThreshold",
+        "0",
+        "string",
+        Option.USER,
+        False,
+        "Percentage of packets (e.g. 0.5) that a worker's packet source may drop before zeekctl cron mails a warning. The percentage is computed from the netstats of each worker since the previous run of zeekctl cron. If this value is 0, then no warning will be sent.",
+    ),
+    Option(
+        "PacketLossNodeThresholds",
+        "",
+        "string",
+        Option.USER,
+        False,
+        "A comma-separated list of node-specific values that override PacketLossThreshold (e.g., worker-1=2.0, worker-2=0). If the node was created from a node.cfg entry with lb_procs, then the name of that entry can be given to apply to all of its nodes.",
+    ),
+    Option(
+        "PacketLossIntervals",
+        3,
+        "int",
+        Option.USER,
+        False,
+        "Number of consecutive runs of zeekctl cron in which a worker's packet loss must exceed its threshold before a warning is sent.",
+    ),
     Option(
         "MinDiskSpace",
         5,
@@ -278,6 +350,54 @@ options = [
         False,
         "Minimum percentage of disk space available before zeekctl cron mails a warning.  If this value is 0, then no warning will be sent.",
     ),
+    Option(
+        "DiskFullHorizon",
+        0,
+        "int",
+        Option.USER,
+        False,
+        "Number of hours within which a disk must be projected to become full (at its current rate of growth) before zeekctl cron mails a warning.  For the disk holding the log directory, the growth is assumed to stop once archived logs expire (see the LogExpireInterval option).  If this value is 0 (the default), then no warning will be sent; a value such as 24 enables the warning.",
+    ),
+    Option(
+        "DiskForecastWindow",
+        6,
+        "int",
+        Option.USER,
+        False,
+        "Number of hours of disk usage history over which zeekctl cron computes the rate of growth of each disk for the DiskFullHorizon option.",
+    ),
+    Option(
+        "CronDaemonTaskIntervals",
+        "",
+        "string",
+        Option.USER,
+        False,
+        "Comma-separated list of <task>=<seconds> entries that override the default intervals at which zeekctl cron --daemon runs each task (an interval of zero disables a task).  The tasks and their default intervals are watch_nodes=60, check_hosts=300, check_capstats_collectors=300, log_stats=300, check_packet_loss=300, check_disk_space=300, summarize_messages=300, expire_logs=3600, expire_stats_db=3600, expire_crash=3600, update_http_stats=300, and run_cron_cmd=300.",
+    ),
+    Option(
+        "CronDaemonJitter",
+        10,
+        "int",
+        Option.USER,
+        False,
+        "Maximum random deviation (in percent of a task's interval) from the interval at which zeekctl cron --daemon runs each task.",
+    ),
+    Option(
+        "MessageSummary",
+        0,
+        "bool",
+        Option.USER,
+        False,
+        "True to have zeekctl cron read the new lines of the reporter.log and stderr.log files of all nodes, and count the distinct messages in them (see the messages command).",
+    ),
+    Option(
+        "MessageSummaryMail",
+        0,
+        "bool",
+        Option.USER,
+        False,
+        "True to have zeekctl cron send mail when it sees a message in a reporter.log or stderr.log file that it hasn't seen before (messages are compared with their variable parts, such as numbers and addresses, replaced by placeholders).  Requires MessageSummary.",
+    ),
     Option(
         "StatsLogEnable",
         1,
@@ -294,6 +414,54 @@ options = [
         False,
         "Number of days entries in the stats.log file are kept (zero means never expire).",
     ),
+    Option(
+        "StatsCSVEnable",
+        1,
+        "bool",
+        Option.USER,
+        False,
+        "True to have zeekctl cron write the meta.dat file and CSV files with the statistics of each node to the www subdirectory of StatsDir, for use by a static web page.  The same data is also available as JSON from the stats endpoints of the zeekctld web interface, which read the stats database directly.",
+    ),
+    Option(
+        "StatsDBRawExpireInterval",
+        1,
+        "int",
+        Option.USER,
+        False,
+        "Number of days the raw samples in the stats database are kept (zero means never expire).  Older statistics are still available from the one-minute and one-hour rollups.",
+    ),
+    Option(
+        "StatsDBMinuteExpireInterval",
+        7,
+        "int",
+        Option.USER,
+        False,
+        "Number of days the one-minute rollups in the stats database are kept (zero means never expire).  The one-hour rollups are kept according to StatsLogExpireInterval.",
+    ),
+    Option(
+        "CapstatsCollector",
+        0,
+        "bool",
+        Option.USER,
+        False,
+        "True to run capstats continuously on the interface of each running worker node. The samples are kept in a ring buffer on each host, and the capstats command and the statistics logged by zeekctl cron are taken from it (instead of running capstats for a few seconds each time). The collectors are started and stopped along with the worker nodes and restarted by zeekctl cron if needed.",
+    ),
+    Option(
+        "CapstatsCollectorInterval",
+        10,
+        "int",
+        Option.USER,
+        False,
+        "Number of seconds each sample of a capstats collector is taken over.",
+    ),
+    Option(
+        "CapstatsCollectorSamples",
+        8640,
+        "int",
+        Option.USER,
+        False,
+        "Number of samples each capstats collector keeps in its ring buffer.",
+    ),
     Option(
         "CrashExpireInterval",
         0,
@@ -310,6 +478,14 @@ options = [
         False,
         "Time interval that archived log files are kept (a value of 0 means log files never expire).  The time interval is expressed as an integer followed by one of the following time units: day, hr, min.",
     ),
+    Option(
+        "LogExpireSize",
+        0,
+        "int",
+        Option.USER,
+        False,
+        "Maximum total size (in GB) of archived log files.  Once it is exceeded, the oldest archived log files are removed (0 means no limit).  Log files matching the KeepLogs option are never removed, but count towards the limit.",
+    ),
     Option(
         "KeepLogs",
         "",
@@ -383,6 +559,38 @@ options = [
         False,
         "True to force the stop command to wait for the post-terminate script to finish, or False to let post-terminate finish in the background.",
     ),
+    Option(
+        "FetchChunkSize",
+        4194304,
+        "int",
+        Option.USER,
+        False,
+        "Maximum number of bytes that the fetch command reads from each node at once (the data is compressed before it is sent).",
+    ),
+    Option(
+        "InstallTransport",
+        "rsync",
+        "string",
+        Option.USER,
+        False,
+        "How the install command copies files to the remote hosts: 'rsync' runs one rsync per host, and 'archive' sends the changes of each directory as a compressed tar archive through the existing connection to each host, where it is unpacked into a staging directory and then moved into place.  With 'archive', whole directories (on the first install of a host, or with install --full) and changes of more than 16 MB are still copied with rsync, because an archive is sent as a single message that must arrive within the command timeout.  Hosts that receive the updates from another host of their sync_group are always updated with rsync.",
+    ),
+    Option(
+        "SyncMaxJobs",
+        10,
+        "int",
+        Option.USER,
+        False,
+        "Maximum number of rsyncs that the install command runs at once to update the remote hosts, and that each host relaying the updates to the other hosts of its sync_group runs at once, or 0 for no limit.",
+    ),
+    Option(
+        "TailMaxLines",
+        100,
+        "int",
+        Option.USER,
+        False,
+        "Maximum number of lines per second that the tail command shows for each node (further lines are dropped, and their number is shown instead), or 0 for no limit.",
+    ),
     Option(
         "CronCmd",
         "",
@@ -548,6 +756,14 @@ options = [
         False,
         "Directory for executable scripts shipping as part of zeekctl.",
     ),
+    Option(
+        "PostProcMaxJobs",
+        0,
+        "int",
+        Option.USER,
+        False,
+        "Maximum number of log postprocessors that run at the same time on a host, across all logs being archived (0 means the number of CPUs of the host).",
+    ),
     Option(
         "PostProcDir",
         "${ZeekBase}/share/zeekctl/scripts/postprocessors",
@@ -737,6 +953,30 @@ options = [
         False,
         "Log file for statistics.",
     ),
+    Option(
+        "InstallManifestDir",
+        "${SpoolDir}/install-manifests",
+        "string",
+        Option.AUTOMATIC,
+        False,
+        "Directory storing the content manifests of the directories that the install command copies to the remote hosts, which are used to copy only the files that changed since the previous install.",
+    ),
+    Option(
+        "MessageDB",
+        "${SpoolDir}/messages.db",
+        "string",
+        Option.AUTOMATIC,
+        False,
+        "Database storing the counts of the distinct messages in the reporter.log and stderr.log files of the nodes.",
+    ),
+    Option(
+        "StatsDB",
+        "${StatsDir}/stats.db",
+        "string",
+        Option.AUTOMATIC,
+        False,
+        "Database storing the statistics collected by zeekctl cron (the same data is also written to the stats.log file).",
+    ),
     Option(
         "DefaultStoreDir",
         "${SpoolDir}/stores",
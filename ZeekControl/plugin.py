@@ -210,6 +210,21 @@ class Plugin:
 
         return self.executor.run_shell_cmds(cmds)
 
+    @doc.api
+    def fetch(self, files):
+        """Copies files or directories from multiple hosts in parallel.
+        ``files`` is a list of tuples ``(node, path, destdir)``, in which the
+        *node* is a `Node`_ instance, *path* is the absolute path of a file or
+        directory on its host, and *destdir* is the local directory to copy
+        it into (at most one tuple per node). The data is transferred
+        compressed and in chunks over the existing connections to the hosts,
+        and unchanged files that were fetched before are skipped. The method
+        returns a list of tuples ``(node, success, output)``, in which
+        ``success`` is True if all files were copied, and ``output`` is a
+        string with a summary of the transfer and any errors."""
+
+        return self.executor.fetch(files, self.getGlobalOption("fetchchunksize"))
+
     ### Methods that must be overridden by plugins.
 
     @doc.api("override")
@@ -9,7 +9,7 @@ import subprocess
 import time
 import zlib
 from queue import Empty, Queue
-from threading import Thread
+from threading import Lock, Thread
 
 
 def get_muxer(shell):
@@ -17,7 +17,7 @@ def get_muxer(shell):
     pythonpath = "@Python_EXECUTABLE@"
 
     muxer = r"""
-import os,sys,subprocess,signal,select,json
+import os,sys,subprocess,signal,select,json,base64,tempfile
 TIMEOUT=120
 
 def w(s):
@@ -28,7 +28,13 @@ def exec_cmds(cmds):
 	p=[]
 	for i,cmd in enumerate(cmds):
 		try:
-			proc=subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE __SHELL__)
+			inp=None
+			if isinstance(cmd,dict):
+				inp=tempfile.TemporaryFile()
+				inp.write(base64.b64decode(cmd["input"]))
+				inp.seek(0)
+				cmd=cmd["cmd"]
+			proc=subprocess.Popen(cmd,stdin=inp,stdout=subprocess.PIPE,stderr=subprocess.PIPE __SHELL__)
 			p.append((i,proc))
 		except Exception as e:
 			w((i,(1,'',str(e))))
@@ -142,6 +148,9 @@ class SSHMaster:
         self.send_commands(cmds, timeout, shell)
         return self.collect_results(timeout)
 
+    # Each command is either a list of arguments, or a dict with the list of
+    # arguments as "cmd" and the base64-encoded data to send to the command's
+    # stdin as "input".
     def send_commands(self, cmds, timeout, shell=False):
         self.connect()
         if shell:
@@ -304,26 +313,33 @@ class HostHandler(Thread):
 class MultiMasterManager:
     def __init__(self, localaddrs=[]):
         self.masters = {}
-        self.response_queues = {}
         self.localaddrs = localaddrs
 
+        # Protects the "masters" dict, as commands can be sent from several
+        # threads at once.
+        self.lock = Lock()
+
     def setup(self, host, timeout):
-        if host not in self.masters:
-            self.masters[host] = HostHandler(host, self.localaddrs, timeout)
-            self.masters[host].start()
+        with self.lock:
+            if host not in self.masters:
+                self.masters[host] = HostHandler(host, self.localaddrs, timeout)
+                self.masters[host].start()
+
+            return self.masters[host]
 
+    # Send commands to a host, and return the queue on which the results will
+    # be received.  Each call gets its own queue, so that concurrent callers
+    # sending commands to the same host don't receive each other's results.
     def send_commands(self, host, commands, timeout, shell=False):
-        self.setup(host, timeout)
         rq = Queue()
-        self.response_queues[host] = rq
-        self.masters[host].send_commands(commands, shell, rq)
+        self.setup(host, timeout).send_commands(commands, shell, rq)
+        return rq
 
-    def get_result(self, host, hosttimeout):
+    def get_result(self, host, rq, count, hosttimeout):
         # Add a few seconds to the host timeout in order to let the
         # command timeout happen first.
         hosttimeout += 5
 
-        rq = self.response_queues[host]
         try:
             return rq.get(timeout=hosttimeout)
         except Empty:
@@ -332,39 +348,49 @@ class MultiMasterManager:
             # loss of connectivity to remote host, or both.
             return [
                 Exception(f"Timeout waiting for commands to finish on host {host}")
-            ]  # FIXME: needs to be the right length
+            ] * count
 
     def exec_command(self, host, command, timeout=30):
         return self.exec_commands(host, [command], timeout)[0]
 
     def exec_commands(self, host, commands, timeout=60):
-        self.send_commands(host, commands, timeout)
-        return self.get_result(host, timeout)
+        rq = self.send_commands(host, commands, timeout)
+        return self.get_result(host, rq, len(commands), timeout)
 
     def exec_multihost_commands(self, cmds, shell=False, timeout=60):
         hosts = collections.defaultdict(list)
         for host, cmd in cmds:
             hosts[host].append(cmd)
 
+        queues = {}
         for host, cmds in hosts.items():
-            self.send_commands(host, cmds, timeout, shell)
+            queues[host] = self.send_commands(host, cmds, timeout, shell)
 
-        for host in hosts:
-            for res in self.get_result(host, timeout):
+        for host, rq in queues.items():
+            for res in self.get_result(host, rq, len(hosts[host]), timeout):
                 yield host, res
 
     def host_status(self):
-        for h, o in self.masters.items():
+        with self.lock:
+            masters = list(self.masters.items())
+
+        for h, o in masters:
             if h not in self.localaddrs:
                 yield h, o.alive
 
     def shutdown(self, host):
-        self.masters[host].shutdown()
-        del self.masters[host]
+        with self.lock:
+            handler = self.masters.pop(host, None)
+
+        if handler:
+            handler.shutdown()
 
     def shutdown_all(self):
-        for handler in self.masters.values():
+        with self.lock:
+            handlers = list(self.masters.values())
+            self.masters = {}
+
+        for handler in handlers:
             handler.shutdown()
-        self.masters = {}
 
     __del__ = shutdown_all
@@ -1,5 +1,6 @@
 import json
 import sqlite3
+import threading
 
 from ZeekControl.exceptions import RuntimeEnvironmentError
 
@@ -8,8 +9,12 @@ class SqliteState:
     def __init__(self, path):
         self.path = path
 
+        # The state can be accessed from several threads (e.g. by cron tasks
+        # running concurrently), so all access is serialized.
+        self.lock = threading.Lock()
+
         try:
-            self.db = sqlite3.connect(self.path)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
         except sqlite3.Error as err:
             raise RuntimeEnvironmentError(
                 f"{err}: {path}\nCheck if the user running ZeekControl has both write and search permission to\nthe directory containing the database file and has both read and write\npermission to the database file itself."
@@ -34,23 +39,29 @@ class SqliteState:
         self.db.commit()
 
     def get(self, key):
-        self.c.execute("SELECT value FROM state WHERE key=?", [key])
-        records = self.c.fetchall()
+        with self.lock:
+            self.c.execute("SELECT value FROM state WHERE key=?", [key])
+            records = self.c.fetchall()
         if records:
             return json.loads(records[0][0])
         return None
 
     def set(self, key, value):
         value = json.dumps(value)
-        try:
-            self.c.execute("REPLACE INTO state (key, value) VALUES (?,?)", [key, value])
-        except sqlite3.Error as err:
-            raise RuntimeEnvironmentError(
-                f"{err}: {self.path}\nCheck if the user running ZeekControl has write access to the database file."
-            )
+        with self.lock:
+            try:
+                self.c.execute(
+                    "REPLACE INTO state (key, value) VALUES (?,?)", [key, value]
+                )
+            except sqlite3.Error as err:
+                raise RuntimeEnvironmentError(
+                    f"{err}: {self.path}\nCheck if the user running ZeekControl has write access to the database file."
+                )
 
-        self.db.commit()
+            self.db.commit()
 
     def items(self):
-        self.c.execute("SELECT key, value FROM state")
-        return [(k, json.loads(v)) for (k, v) in self.c.fetchall()]
+        with self.lock:
+            self.c.execute("SELECT key, value FROM state")
+            records = self.c.fetchall()
+        return [(k, json.loads(v)) for (k, v) in records]
@@ -0,0 +1,412 @@
+import os
+import sqlite3
+import time
+
+from ZeekControl.exceptions import RuntimeEnvironmentError
+
+# The rollup tiers, given as the length of their intervals in seconds.  Tier 0
+# are the raw samples.
+TIERS = (0, 60, 3600)
+
+# Maximum number of intervals per series that a query should cover when the
+# tier is chosen automatically.
+MAX_INTERVALS = 1440
+
+
+class StatsStore:
+    """Time-series store for the statistics collected by zeekctl cron.
+
+    Each sample is a tuple (time, node, type, metric, value) corresponding to
+    one line "<time> <node> <type> <metric> <value>" of the stats.log file.
+    Samples are indexed by (node, metric, time) and by time, so that range
+    queries for a node and expiring old samples don't need to scan the whole
+    history.  The latest value of each metric is kept in a separate table.
+
+    For each numeric sample, the store also maintains rollups with the count,
+    sum, minimum and maximum of the values within one-minute and one-hour
+    intervals.  These are updated as samples are added, and allow the raw
+    samples to be expired sooner while queries over long time ranges stay
+    cheap.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        try:
+            if path != ":memory:":
+                dirname = os.path.dirname(path)
+                if dirname and not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+
+            # Cron tasks that use the database can run concurrently, so wait
+            # for a while if the database is locked by another one.
+            self.db = sqlite3.connect(self.path, timeout=60)
+        except (OSError, sqlite3.Error) as err:
+            raise RuntimeEnvironmentError(
+                f"{err}: {path}\nCheck if the user running ZeekControl has both write and search permission to\nthe directory containing the database file and has both read and write\npermission to the database file itself."
+            )
+
+        self.c = self.db.cursor()
+
+        try:
+            self.setup()
+        except sqlite3.Error as err:
+            raise RuntimeEnvironmentError(
+                f"{err}: {path}\nCheck if the user running ZeekControl has write access to the database file.\nOtherwise, the database file is possibly corrupt."
+            )
+
+    def setup(self):
+        # Values are stored with numeric affinity, so that numbers can be
+        # aggregated while other values (e.g. error messages) are kept as text.
+        self.c.execute("""CREATE TABLE IF NOT EXISTS samples (
+            time   REAL     NOT NULL,
+            node   TEXT     NOT NULL,
+            type   TEXT     NOT NULL,
+            metric TEXT     NOT NULL,
+            value  NUMERIC
+        )""")
+
+        self.c.execute(
+            "CREATE INDEX IF NOT EXISTS samples_node_metric_time ON samples (node, metric, time)"
+        )
+        self.c.execute("CREATE INDEX IF NOT EXISTS samples_time ON samples (time)")
+
+        self.c.execute("""CREATE TABLE IF NOT EXISTS latest (
+            node   TEXT     NOT NULL,
+            type   TEXT     NOT NULL,
+            metric TEXT     NOT NULL,
+            time   REAL     NOT NULL,
+            value  NUMERIC,
+            PRIMARY KEY (node, type, metric)
+        )""")
+
+        self.c.execute("""CREATE TABLE IF NOT EXISTS rollups (
+            tier   INTEGER  NOT NULL,
+            time   REAL     NOT NULL,
+            node   TEXT     NOT NULL,
+            type   TEXT     NOT NULL,
+            metric TEXT     NOT NULL,
+            count  INTEGER  NOT NULL,
+            sum    REAL     NOT NULL,
+            min    REAL     NOT NULL,
+            max    REAL     NOT NULL,
+            PRIMARY KEY (tier, node, metric, type, time)
+        )""")
+
+        self.c.execute(
+            "CREATE INDEX IF NOT EXISTS rollups_tier_time ON rollups (tier, time)"
+        )
+
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # Add a list of (time, node, type, metric, value) samples.
+    def add(self, samples):
+        samples = [(float(t), str(n), ty, m, v) for (t, n, ty, m, v) in samples]
+        if not samples:
+            return
+
+        try:
+            self.c.executemany(
+                "INSERT INTO samples (time, node, type, metric, value) VALUES (?,?,?,?,?)",
+                samples,
+            )
+
+            # Samples are not necessarily added in time order (e.g. capstats
+            # collector samples), so only replace a latest value by a newer one.
+            self.c.executemany(
+                """INSERT INTO latest (time, node, type, metric, value) VALUES (?,?,?,?,?)
+                   ON CONFLICT (node, type, metric) DO UPDATE
+                   SET time=excluded.time, value=excluded.value
+                   WHERE excluded.time >= latest.time""",
+                samples,
+            )
+
+            self.c.executemany(
+                """INSERT INTO rollups (tier, time, node, type, metric, count, sum, min, max)
+                   VALUES (?,?,?,?,?,1,?,?,?)
+                   ON CONFLICT (tier, node, metric, type, time) DO UPDATE
+                   SET count=count+1, sum=sum+excluded.sum,
+                       min=min(min, excluded.min), max=max(max, excluded.max)""",
+                self._rollup_rows(samples),
+            )
+        except sqlite3.Error as err:
+            self.db.rollback()
+            raise RuntimeEnvironmentError(
+                f"{err}: {self.path}\nCheck if the user running ZeekControl has write access to the database file."
+            )
+
+        self.db.commit()
+
+    # Return the (time, node, type, metric, value) samples with
+    # start <= time < end, ordered by time.  Any of the arguments can be None
+    # to not restrict the result by it.  The "nodes" and "metrics" arguments
+    # are lists of names.
+    def query(self, start=None, end=None, nodes=None, types=None, metrics=None):
+        where, args = self._where(start, end, nodes, types, metrics)
+        self.c.execute(
+            f"SELECT time, node, type, metric, value FROM samples {where} ORDER BY time",
+            args,
+        )
+        return self.c.fetchall()
+
+    # Return a dict that maps (node, type, metric) to a tuple of the time and
+    # value of the most recent sample.
+    def latest(self, nodes=None, types=None, metrics=None):
+        where, args = self._where(None, None, nodes, types, metrics)
+        self.c.execute(
+            f"SELECT node, type, metric, time, value FROM latest {where}", args
+        )
+        return {(n, ty, m): (t, v) for (n, ty, m, t, v) in self.c.fetchall()}
+
+    # Return the names of all nodes for which there are samples.
+    def nodes(self):
+        self.c.execute("SELECT DISTINCT node FROM latest ORDER BY node")
+        return [n for (n,) in self.c.fetchall()]
+
+    # Return the rows (time, count, avg, min, max) aggregated over the
+    # intervals of the given tier with start <= time < end, for each node,
+    # type and metric.  The result is a tuple of the tier and a list of
+    # (time, node, type, metric, count, avg, min, max) rows ordered by time.
+    # Raw samples (tier 0) with non-numeric values are skipped.  If no tier
+    # is given, then the one chosen by select_tier() is used.
+    def rollup(
+        self, start=None, end=None, nodes=None, types=None, metrics=None, tier=None
+    ):
+        if tier is None:
+            tier = self.select_tier(start, end)
+
+        if tier == 0:
+            rows = []
+            for t, n, ty, m, v in self.query(start, end, nodes, types, metrics):
+                if isinstance(v, (int, float)):
+                    rows.append((t, n, ty, m, 1, v, v, v))
+            return tier, rows
+
+        where, args = self._where(
+            start, end, nodes, types, metrics, ["tier = ?"], [tier]
+        )
+        self.c.execute(
+            f"""SELECT time, node, type, metric, count, sum / count, min, max
+                FROM rollups {where} ORDER BY time""",
+            args,
+        )
+        return tier, self.c.fetchall()
+
+    # Return the finest tier that still has data for the given start time,
+    # and whose number of intervals over the time range doesn't exceed
+    # MAX_INTERVALS.  Raw samples are counted as one-minute intervals.
+    def select_tier(self, start=None, end=None, now=None):
+        if end is None:
+            end = now if now is not None else time.time()
+
+        for tier in TIERS:
+            oldest = self._oldest(tier)
+            if oldest is None:
+                continue
+
+            if start is not None:
+                if oldest > start + max(tier, 60):
+                    continue
+
+                if (end - start) / max(tier, 60) > MAX_INTERVALS:
+                    continue
+
+            return tier
+
+        return TIERS[-1]
+
+    # Remove all samples of the given tier older than the given time, and
+    # return the number of samples removed.  Expiring the raw samples (tier
+    # 0) also expires the latest values.
+    def expire(self, before, tier=0):
+        try:
+            if tier == 0:
+                self.c.execute("DELETE FROM samples WHERE time < ?", [before])
+                count = self.c.rowcount
+                self.c.execute("DELETE FROM latest WHERE time < ?", [before])
+            else:
+                self.c.execute(
+                    "DELETE FROM rollups WHERE tier=? AND time < ?", [tier, before]
+                )
+                count = self.c.rowcount
+        except sqlite3.Error as err:
+            self.db.rollback()
+            raise RuntimeEnvironmentError(
+                f"{err}: {self.path}\nCheck if the user running ZeekControl has write access to the database file."
+            )
+
+        self.db.commit()
+        return count
+
+    # Return the time of the oldest sample in the given tier, or None if there
+    # are none.
+    def _oldest(self, tier):
+        if tier == 0:
+            self.c.execute("SELECT MIN(time) FROM samples")
+        else:
+            self.c.execute("SELECT MIN(time) FROM rollups WHERE tier=?", [tier])
+
+        return self.c.fetchone()[0]
+
+    # Return the rows to add to the rollup tiers for the given samples.
+    def _rollup_rows(self, samples):
+        rows = []
+
+        for t, n, ty, m, v in samples:
+            try:
+                v = float(v)
+            except (TypeError, ValueError):
+                continue
+
+            for tier in TIERS[1:]:
+                rows.append((tier, t - t % tier, n, ty, m, v, v, v))
+
+        return rows
+
+    # Return an SQL WHERE clause (or an empty string) and its arguments,
+    # which restrict a query by the given arguments and any additional
+    # conditions.
+    def _where(self, start, end, nodes, types, metrics, conds=None, args=None):
+        conds = list(conds or [])
+        args = list(args or [])
+
+        if start is not None:
+            conds.append("time >= ?")
+            args.append(start)
+
+        if end is not None:
+            conds.append("time < ?")
+            args.append(end)
+
+        for col, vals in (("node", nodes), ("type", types), ("metric", metrics)):
+            if vals:
+                vals = [str(v) for v in vals]
+                conds.append(f"{col} IN ({','.join('?' * len(vals))})")
+                args += vals
+
+        if not conds:
+            return "", args
+
+        return "WHERE " + " AND ".join(conds), args
+
+
+# Units of relative times understood by parse_time().
+TIME_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# Aggregation functions understood by aggregate(), besides percentiles which
+# are given as "p<N>" (e.g. "p95").
+AGGREGATES = ("count", "avg", "min", "max", "rate")
+
+
+# Parse a time given as seconds since the epoch, as "now", as a time relative
+# to now (e.g. "90m" or "2d" ago), or as a local date and time in ISO format
+# ("YYYY-MM-DD", "YYYY-MM-DDTHH:MM" or "YYYY-MM-DDTHH:MM:SS").  Returns
+# seconds since the epoch, or raises ValueError.
+def parse_time(s, now=None):
+    if now is None:
+        now = time.time()
+
+    if s == "now":
+        return now
+
+    if s[-1:] in TIME_UNITS and s[:-1].isdigit():
+        return now - int(s[:-1]) * TIME_UNITS[s[-1]]
+
+    try:
+        return float(s)
+    except ValueError:
+        pass
+
+    for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return time.mktime(time.strptime(s, fmt))
+        except ValueError:
+            pass
+
+    raise ValueError(f"invalid time: {s}")
+
+
+# Check a list of aggregation function names, and raise ValueError if any
+# of them is unknown.
+def check_aggregates(aggs):
+    for agg in aggs:
+        if agg in AGGREGATES:
+            continue
+
+        if agg.startswith("p"):
+            try:
+                if 0 <= float(agg[1:]) <= 100:
+                    continue
+            except ValueError:
+                pass
+
+        raise ValueError(f"unknown aggregation function: {agg}")
+
+
+# Return the p-th percentile (0 <= p <= 100) of a non-empty list of values,
+# interpolating linearly between the closest ranks.
+def percentile(values, p):
+    values = sorted(values)
+    pos = (len(values) - 1) * p / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+# Aggregate rows as returned by StatsStore.rollup() into groups.  The "key"
+# argument is a function that returns the group name for a row.  Returns a
+# sorted list of ((group, type, metric), vals) tuples, where vals is a dict
+# that maps each of the given aggregation functions to its value.
+#
+# Percentiles are computed over the average of each interval, so they are
+# exact only for raw samples.  The rate is the sum of the per-second rates
+# of change over the time range of each node's values, which is useful for
+# counters (e.g. "utime").
+def aggregate(rows, aggs, key):
+    groups = {}
+
+    for row in rows:
+        t, node, typ, metric, count, avg, vmin, vmax = row
+        g = groups.setdefault((key(row), typ, metric), {"rows": [], "series": {}})
+        g["rows"].append(row)
+
+        # Keep the first and last value of each node.
+        series = g["series"].get(node)
+        if series is None:
+            g["series"][node] = [t, avg, t, avg]
+        else:
+            series[2:] = [t, avg]
+
+    result = []
+
+    for group, g in sorted(groups.items()):
+        rows = g["rows"]
+        total = sum(r[4] for r in rows)
+        vals = {}
+
+        for agg in aggs:
+            if agg == "count":
+                vals[agg] = total
+            elif agg == "avg":
+                vals[agg] = sum(r[4] * r[5] for r in rows) / total
+            elif agg == "min":
+                vals[agg] = min(r[6] for r in rows)
+            elif agg == "max":
+                vals[agg] = max(r[7] for r in rows)
+            elif agg == "rate":
+                rate = None
+                for t0, v0, t1, v1 in g["series"].values():
+                    # Skip nodes with a single value, or whose counters
+                    # were reset by a restart.
+                    if t1 > t0 and v1 >= v0:
+                        rate = (rate or 0.0) + (v1 - v0) / (t1 - t0)
+                vals[agg] = rate
+            else:
+                vals[agg] = percentile([r[5] for r in rows], float(agg[1:]))
+
+        result.append((group, vals))
+
+    return result
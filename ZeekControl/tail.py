@@ -0,0 +1,108 @@
+# Following log files of the nodes for the tail command.
+#
+# The files are read in rounds with the read-file helper, through the same
+# per-host connections as all other commands.  Each read returns at most a
+# fixed number of bytes per node, and the next round starts only once the
+# lines of the previous one have been consumed, so a node that writes faster
+# than the lines can be shown only falls behind; once it is too far behind,
+# the data in between is skipped.  In addition, the number of lines shown per
+# node and second is limited.
+
+import base64
+import codecs
+
+# The maximum number of bytes read from a file in one round.
+MAXBYTES = 65536
+
+# Once the unread part of a file is longer than this, it is skipped.
+MAXBACKLOG = 4 * MAXBYTES
+
+
+class LogTail:
+    # Follow a file, starting with its last "lines" lines.  At most "maxrate"
+    # lines per second are returned (zero means no limit).
+    def __init__(self, path, lines=10, maxrate=0):
+        self.path = path
+        self.lines = lines
+        self.maxrate = maxrate
+        self.allowance = maxrate
+        self.last = None
+
+        # A negative offset counts from the end of the file.
+        self.offset = -MAXBYTES
+        self.first = True
+        self.rest = ""
+
+        # A multibyte character split between two reads is kept until the
+        # rest of it arrives.
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    # Return the arguments of the read-file helper for the next read.
+    def args(self):
+        return [self.path, str(self.offset), str(MAXBYTES)]
+
+    # Process the output of the read-file helper and return the new lines to
+    # show, along with notes about lines that were dropped or skipped (in
+    # brackets).  Raises ValueError if the output cannot be parsed.
+    def feed(self, output, now):
+        header, _, data = output.partition("\n")
+
+        if header.strip() == "-":
+            # The file does not exist (yet), so read it from the start once
+            # it's created.
+            self.offset = 0
+            self.first = False
+            return []
+
+        try:
+            size, offset, count = (int(v) for v in header.split())
+            data = base64.b64decode(data)
+        except ValueError:
+            raise ValueError(f"unexpected output of read-file: {header}")
+
+        notes = []
+
+        if self.offset > 0 and offset < self.offset:
+            notes.append("[file truncated]")
+            self.rest = ""
+            self.decoder.reset()
+
+        self.offset = offset + count
+
+        lines = (self.rest + self.decoder.decode(data)).split("\n")
+        self.rest = lines.pop()
+
+        # A line longer than we read at once is shown in parts.
+        if len(self.rest) >= MAXBYTES:
+            lines.append(self.rest)
+            self.rest = ""
+
+        if self.first:
+            # Drop the first line if we started in the middle of it.
+            if offset > 0:
+                lines = lines[1:]
+
+            self.first = False
+            self.last = now
+            return lines[-self.lines :] if self.lines > 0 else []
+
+        if size - self.offset > MAXBACKLOG:
+            notes.append(f"[{size - self.offset} bytes skipped]")
+            self.offset = size
+            self.rest = ""
+            self.decoder.reset()
+
+        if self.maxrate:
+            self.allowance = min(
+                self.maxrate, self.allowance + (now - self.last) * self.maxrate
+            )
+            self.last = now
+
+            shown = max(int(self.allowance), 0)
+            if len(lines) > shown:
+                notes.append(f"[{len(lines) - shown} lines dropped]")
+                lines = lines[:shown]
+
+            self.allowance -= len(lines)
+
+        return lines + notes
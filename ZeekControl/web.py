@@ -1,11 +1,10 @@
-import json
-
 import bottle
 
+from ZeekControl import version
 from ZeekControl.ser import dumps
 
 app = bottle.Bottle(autojson=False)
-app.install(bottle.JSONPlugin(json_dumps=lambda s: json.dumps(s, default=dumps)))
+app.install(bottle.JSONPlugin(json_dumps=dumps))
 
 
 @app.route("/start")
@@ -33,6 +32,38 @@ def nodes():
     return {"result": s}
 
 
+# Return the list of nodes given in the "nodes" query parameter (separated
+# by commas) as a node list argument for the zeekctl API.
+def _node_list():
+    return " ".join(bottle.request.query.get("nodes", "").split(","))
+
+
+@app.route("/stats/meta")
+def stats_meta():
+    s = app.daemon.sync_call("nodes")
+    return {"version": version.VERSION, "result": s}
+
+
+@app.route("/stats/latest")
+def stats_latest():
+    s = app.daemon.sync_call("stats_latest", _node_list())
+    return {"result": s}
+
+
+@app.route("/stats/series/:metrics")
+def stats_series(metrics):
+    q = bottle.request.query
+    s = app.daemon.sync_call(
+        "stats_series",
+        metrics.split(","),
+        q.get("from", "1h"),
+        q.get("to", "now"),
+        q.get("resolution"),
+        _node_list(),
+    )
+    return {"result": s}
+
+
 @app.route("/exec/:cmd")
 def cmd_start(cmd):
     i = app.daemon.call("execute", cmd)
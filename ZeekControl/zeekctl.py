@@ -3,10 +3,27 @@
 import logging
 import os
 import sys
-
-from ZeekControl import cmdresult, config, control, execute, lock, pluginreg, version
+import threading
+import time
+
+from ZeekControl import (
+    cmdresult,
+    config,
+    control,
+    cron,
+    execute,
+    lock,
+    pluginreg,
+    statsdb,
+    version,
+)
 from ZeekControl import node as node_mod
-from ZeekControl.exceptions import InvalidNodeError, LockError, RuntimeEnvironmentError
+from ZeekControl.exceptions import (
+    CommandSyntaxError,
+    InvalidNodeError,
+    LockError,
+    RuntimeEnvironmentError,
+)
 
 
 class TermUI:
@@ -262,9 +279,9 @@ class ZeekCtl:
     @expose
     @check_config
     @lock_required
-    def install(self, local=False):
+    def install(self, local=False, full=False):
         if self.plugins.cmdPre("install"):
-            results = self.controller.install(local)
+            results = self.controller.install(local, full)
         else:
             results = cmdresult.CmdResult(ok=False)
 
@@ -389,6 +406,77 @@ class ZeekCtl:
 
         return results
 
+    # Aggregate the statistics collected by zeekctl cron.  The metrics
+    # (default "cpu") of the given nodes within the time range from start to
+    # end (see statsdb.parse_time for the formats) are aggregated by "node",
+    # "type", "host", or over "all" nodes.  The aggregation functions default
+    # to "avg", "max", and "p95".  If a host is given, then only nodes running
+    # on that host are included.
+    @expose
+    @check_config
+    def stats(
+        self,
+        metrics=None,
+        start="1h",
+        end="now",
+        aggregates=None,
+        groupby="node",
+        host=None,
+        node_list=None,
+    ):
+        nodes = self.node_args(node_list)
+        if host:
+            nodes = [n for n in nodes if n.host == host]
+
+        metrics = metrics or ["cpu"]
+        aggregates = aggregates or ["avg", "max", "p95"]
+
+        try:
+            start = statsdb.parse_time(str(start))
+            end = statsdb.parse_time(str(end))
+            statsdb.check_aggregates(aggregates)
+        except ValueError as err:
+            raise CommandSyntaxError(str(err))
+
+        if groupby not in ("node", "type", "host", "all"):
+            raise CommandSyntaxError(f"cannot group statistics by '{groupby}'")
+
+        return self.controller.stats(nodes, metrics, start, end, aggregates, groupby)
+
+    # Return the time series of the given metrics (default "cpu") of the
+    # given nodes within the time range from start to end.  The resolution
+    # is the tier of the stats database to use (0 for raw samples, 60 or 3600
+    # for rollups), or None to choose one depending on the time range.
+    @expose
+    @check_config
+    def stats_series(
+        self, metrics=None, start="1h", end="now", resolution=None, node_list=None
+    ):
+        nodes = self.node_args(node_list)
+        metrics = metrics or ["cpu"]
+
+        try:
+            start = statsdb.parse_time(str(start))
+            end = statsdb.parse_time(str(end))
+        except ValueError as err:
+            raise CommandSyntaxError(str(err))
+
+        if resolution is not None:
+            if str(resolution) not in [str(t) for t in statsdb.TIERS]:
+                raise CommandSyntaxError(f"invalid resolution: {resolution}")
+
+            resolution = int(resolution)
+
+        return self.controller.stats_series(nodes, metrics, start, end, resolution)
+
+    # Return the latest value of each metric of the given nodes from the stats
+    # database.
+    @expose
+    @check_config
+    def stats_latest(self, node_list=None):
+        nodes = self.node_args(node_list)
+        return self.controller.stats_latest(nodes)
+
     @expose
     @check_config
     @lock_required
@@ -410,6 +498,85 @@ class ZeekCtl:
 
         return True
 
+    # Run the cron tasks repeatedly, each one at its own interval (see the
+    # CronDaemonTaskIntervals option).  The lock is held only while tasks
+    # are running, so that other zeekctl commands can be used meanwhile.
+    # Slow tasks (see cron.SLOW_TASKS) are run in a separate thread with
+    # its own executor, so that they cannot delay the other tasks (these
+    # don't need the lock as they don't modify any zeekctl state, access to
+    # the state database is serialized, and the stats.log file that both
+    # expire_logs and update_http_stats write to is protected by a file
+    # lock).  An exception raised by a task is reported, and the tasks are
+    # run again at their next interval.  Returns True
+    # when the zeekctl config files have changed, in which case the caller
+    # should create a new ZeekCtl instance and call this method again.
+    @expose
+    def cron_daemon(self, watch=True):
+        scheduler = cron.CronScheduler(
+            self.config.cron_task_intervals(), self.config.crondaemonjitter
+        )
+        cfghash = self.config.get_cfg_hash()
+        worker = None
+
+        try:
+            while True:
+                idle = worker is None or not worker.is_alive()
+                if idle and self.config.get_cfg_hash() != cfghash:
+                    return True
+
+                due = scheduler.due(time.time())
+                tasks = [name for name in due if name not in cron.SLOW_TASKS]
+                slowtasks = [name for name in due if name in cron.SLOW_TASKS]
+
+                if tasks:
+                    self._cron_daemon_run(watch, tasks)
+
+                if slowtasks:
+                    if idle:
+                        worker = threading.Thread(
+                            target=self._cron_daemon_worker, args=(watch, slowtasks)
+                        )
+                        worker.start()
+                    else:
+                        logging.debug(
+                            "cron daemon: still running slow tasks, skipping %s",
+                            slowtasks,
+                        )
+
+                time.sleep(min(max(scheduler.next_due() - time.time(), 1), 60))
+        finally:
+            if worker:
+                worker.join()
+
+    def _cron_daemon_run(self, watch, tasks):
+        try:
+            self.lock(showwait=False)
+        except LockError:
+            logging.debug("cron daemon: failed to get lock, skipping %s", tasks)
+            return
+
+        try:
+            if self.plugins.cmdPre("cron", "", watch):
+                self.controller.cron(watch, tasks)
+            self.plugins.cmdPost("cron", "", watch)
+        except Exception as err:
+            self._cron_daemon_error(tasks, err)
+        finally:
+            self.unlock()
+
+    def _cron_daemon_worker(self, watch, tasks):
+        executor = execute.Executor(self.config)
+        try:
+            self.controller.cron(watch, tasks, executor)
+        except Exception as err:
+            self._cron_daemon_error(tasks, err)
+        finally:
+            executor.finish()
+
+    def _cron_daemon_error(self, tasks, err):
+        logging.exception("cron daemon: failed to run %s", tasks)
+        self.ui.error(f"cron daemon: failed to run {', '.join(tasks)}: {err}")
+
     @expose
     @check_config
     @lock_required
@@ -483,6 +650,66 @@ class ZeekCtl:
 
         return results
 
+    # Find the archived logs of the given types (default: all) which cover
+    # any part of the time range from start to end (see statsdb.parse_time for
+    # the formats; default: unbounded).  If grep is given, only the logs
+    # containing that string within the time range are returned, along with
+    # the matching lines.
+    @expose
+    @check_config
+    def logs_find(self, types=None, start=None, end=None, grep=None):
+        try:
+            if start is not None:
+                start = statsdb.parse_time(str(start))
+            if end is not None:
+                end = statsdb.parse_time(str(end))
+        except ValueError as err:
+            raise CommandSyntaxError(str(err))
+
+        return self.controller.logs_find(types or [], start, end, grep)
+
+    # Return the "top" most frequent distinct messages in the reporter.log and
+    # stderr.log files of the given nodes, after reading the lines that were
+    # appended since the previous call (or run of zeekctl cron).  The keyval
+    # of the result is a list of (level, template, example, count, nodes,
+    # first, last) tuples.  If "reset" is true, the counts are reset first.
+    @expose
+    @check_config
+    @lock_required
+    def messages(self, top=10, reset=False, node_list=None):
+        nodes = self.node_args(node_list)
+        return self.controller.messages(nodes, top, reset)
+
+    # Copy the given file or directory (relative to the working directory of
+    # the nodes, unless absolute) from each of the given nodes into a
+    # subdirectory of "destdir" named after the node.  Files that were
+    # fetched before and did not change are skipped, and interrupted fetches
+    # are resumed.
+    @expose
+    @check_config
+    def fetch(self, path, destdir=".", node_list=None):
+        nodes = self.node_args(node_list)
+        return self.controller.fetch(nodes, path, destdir)
+
+    # Return a generator of (node, line) tuples of the lines of the given file
+    # (default "stderr.log") in the working directory of each of the given
+    # nodes, starting with the last "lines" lines.  If "follow" is true, then
+    # the generator keeps yielding lines as they are appended to the files.
+    @expose
+    @check_config
+    def tail(self, filename=None, lines=10, follow=True, node_list=None):
+        if lines < 0:
+            raise CommandSyntaxError(f"number of lines cannot be negative: {lines}")
+
+        filename = filename or "stderr.log"
+        if os.path.isabs(filename) or os.pardir in filename.split(os.sep):
+            raise CommandSyntaxError(
+                f"file must be in the working directory of the nodes: {filename}"
+            )
+
+        nodes = self.node_args(node_list)
+        return self.controller.tail(nodes, filename, lines, follow)
+
     @expose
     @check_config
     @lock_required
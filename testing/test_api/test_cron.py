@@ -0,0 +1,149 @@
+import time
+import types
+
+import pytest
+
+from ZeekControl import cron
+from ZeekControl.control import Controller
+from ZeekControl.cron import (
+    CronScheduler,
+    disk_growth_rate,
+    disk_time_to_full,
+    packet_loss,
+    parse_netstats,
+    task_dependencies,
+)
+
+
+def test_parse_netstats():
+    out = "1365006359.859727 recvd=100 dropped=2 link=102"
+    assert parse_netstats(out) == (100, 2)
+
+
+def test_parse_netstats_bad():
+    with pytest.raises(ValueError):
+        parse_netstats("1365006359.859727 recvd=100")
+
+    with pytest.raises(ValueError):
+        parse_netstats("1365006359.859727 recvd=x dropped=2")
+
+
+def test_packet_loss():
+    assert packet_loss((100, 0), (190, 10)) == 10.0
+    assert packet_loss((100, 5), (200, 5)) == 0.0
+
+
+def test_packet_loss_reset():
+    # Counters were reset by a restart.
+    assert packet_loss((1000, 50), (100, 0)) is None
+
+    # No packets at all.
+    assert packet_loss((100, 5), (100, 5)) is None
+
+
+def test_disk_growth_rate():
+    history = [(0.0, 100.0), (100.0, 300.0), (200.0, 400.0), (300.0, 700.0)]
+    assert disk_growth_rate(history) == pytest.approx(1.9)
+
+    assert disk_growth_rate([(0.0, 100.0)]) is None
+    assert disk_growth_rate([(10.0, 100.0), (10.0, 200.0)]) is None
+
+
+def test_disk_time_to_full():
+    history = [(0.0, 1000.0), (3600.0, 4600.0)]
+    assert disk_time_to_full(history, 36000.0) == 36000.0
+
+    # Usage is not growing.
+    assert disk_time_to_full([(0.0, 1000.0), (3600.0, 900.0)], 100.0) is None
+
+    # The logs expire before the space left is used up.
+    assert disk_time_to_full(history, 36000.0, retention=3600) is None
+    assert disk_time_to_full(history, 36000.0, retention=86400) == 36000.0
+
+
+def test_cron_scheduler():
+    intervals = {"watch_nodes": 60, "log_stats": 300, "expire_logs": 3600}
+    s = CronScheduler(intervals, 0, now=1000.0)
+
+    # All tasks are due at startup, in the order in which cron runs them.
+    assert s.due(1000.0) == ["watch_nodes", "log_stats", "expire_logs"]
+    assert s.due(1000.0) == []
+    assert s.next_due() == 1060.0
+
+    assert s.due(1060.0) == ["watch_nodes"]
+    assert s.due(1300.0) == ["watch_nodes", "log_stats"]
+    assert s.due(4600.0) == ["watch_nodes", "log_stats", "expire_logs"]
+
+
+def test_cron_scheduler_jitter():
+    intervals = {"watch_nodes": 100}
+
+    s = CronScheduler(intervals, 10, now=0.0, rand=lambda: 1.0)
+    assert s.next_due() == 10.0
+    assert s.due(10.0) == ["watch_nodes"]
+    assert s.next_due() == 120.0
+
+    s = CronScheduler(intervals, 10, now=0.0, rand=lambda: 0.0)
+    assert s.due(0.0) == ["watch_nodes"]
+    assert s.next_due() == 90.0
+
+
+def test_task_dependencies():
+    tasks = ["watch_nodes", "check_capstats_collectors", "log_stats", "run_cron_cmd"]
+
+    assert task_dependencies("watch_nodes", tasks) == []
+    assert task_dependencies("log_stats", tasks) == [
+        "check_capstats_collectors",
+        "watch_nodes",
+    ]
+    assert task_dependencies("run_cron_cmd", tasks) == tasks[:-1]
+
+    # Only dependencies among the given tasks are returned.
+    assert task_dependencies("update_http_stats", ["update_http_stats"]) == []
+
+
+def test_cron_tasks_stats_log_order(monkeypatch):
+    events = []
+
+    def run(self, name):
+        events.append(("start", name))
+        if name == "expire_logs":
+            time.sleep(0.1)
+        events.append(("end", name))
+
+    monkeypatch.setattr(cron.CronTasks, "run", run)
+    controller = types.SimpleNamespace(config=None, pluginregistry=None)
+    tasks = [name for name, _ in cron.TASKS]
+    Controller._run_cron_tasks(controller, tasks, None)
+
+    # Both write to the stats.log in StatsDir, so they must not overlap.
+    assert events.index(("end", "expire_logs")) < events.index(
+        ("start", "update_http_stats")
+    )
+
+
+def test_cron_tasks_failure(monkeypatch):
+    started = []
+
+    def run(self, name):
+        started.append(name)
+        self.ui.info(f"{name} ran")
+        if name == "log_stats":
+            raise OSError("disk full")
+
+    monkeypatch.setattr(cron.CronTasks, "run", run)
+    controller = types.SimpleNamespace(config=None, pluginregistry=None)
+    tasks = [name for name, _ in cron.TASKS]
+    outputs = dict(zip(tasks, Controller._run_cron_tasks(controller, tasks, None)))
+
+    # The failing task's own output is kept along with the error.
+    assert (
+        outputs["log_stats"] == "log_stats ran\ncron task log_stats failed: disk full\n"
+    )
+
+    # Tasks depending on the failed one are skipped, the others still run.
+    assert "update_http_stats" not in started
+    assert outputs["update_http_stats"] == (
+        "cron task update_http_stats skipped: log_stats failed\n"
+    )
+    assert outputs["expire_logs"] == "expire_logs ran\n"
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+
+from ZeekControl.execute import Executor, make_archive, run_localcmds
+
+UNPACK = os.path.join(
+    os.path.dirname(__file__), "..", "..", "bin", "helpers", "unpack-archive"
+)
+
+
+def test_run_localcmds_maxjobs():
+    cmds = [(i, f"echo {i}", "", None) for i in range(5)]
+    cmds.append((5, "cat; exit 1", "", "input"))
+
+    for maxjobs in (0, 2):
+        results = run_localcmds(cmds, maxjobs)
+        assert [id for id, _, _ in results] == list(range(6))
+        assert results[3] == (3, True, "3\n")
+        assert results[5] == (5, False, "input")
+
+
+def unpack(path, mode, data):
+    proc = subprocess.run(
+        [sys.executable, UNPACK, str(path), mode], input=data, capture_output=True
+    )
+    return proc.returncode, proc.stdout.decode()
+
+
+def test_unpack_archive(tmp_path):
+    src = tmp_path / "src" / "tree"
+    dst = tmp_path / "dst" / "tree"
+    (src / "sub").mkdir(parents=True)
+    (src / "a").write_text("a")
+    (src / "sub" / "b").write_text("b")
+
+    assert unpack(dst, "full", make_archive(str(src))) == (0, "")
+    assert (dst / "sub" / "b").read_text() == "b"
+
+    # A delta replaces the changed files without touching the installed ones,
+    # which the staged copy shares with hard links.
+    installed = open(dst / "a")
+    (src / "a").write_text("new")
+    (src / "c").write_text("c")
+    data = make_archive(str(src), ["a", "c"], ["sub"])
+    assert unpack(dst, "delta", data) == (0, "")
+    assert sorted(os.listdir(dst)) == ["a", "c"]
+    assert (dst / "a").read_text() == "new"
+    assert installed.read() == "a"
+    installed.close()
+    assert os.listdir(tmp_path / "dst") == ["tree"]
+
+    # A broken archive leaves the installed version alone.
+    for broken in (b"[]\nbroken", make_archive(str(src))[:-10]):
+        rc, out = unpack(dst, "full", broken)
+        assert rc == 1 and out.startswith("cannot install")
+    assert sorted(os.listdir(dst)) == ["a", "c"]
+
+
+def test_unpack_archive_single_file(tmp_path):
+    src = tmp_path / "src" / "zeekctl-config.sh"
+    dst = tmp_path / "dst" / "zeekctl-config.sh"
+    src.parent.mkdir()
+    src.write_text("old")
+
+    assert unpack(dst, "full", make_archive(str(src))) == (0, "")
+
+    # The manifest of a changed single file lists only ".".
+    src.write_text("new")
+    assert unpack(dst, "delta", make_archive(str(src), ["."])) == (0, "")
+    assert dst.read_text() == "new"
+    assert os.listdir(tmp_path / "dst") == ["zeekctl-config.sh"]
+
+
+def test_sync_archives_unreadable(tmp_path):
+    class Node:
+        name = "worker-1"
+
+    class TestExecutor(Executor):
+        def __init__(self):
+            self.cmds = []
+
+        def run_helper(self, cmds, shell=False):
+            self.cmds += cmds
+            return [(node, True, "") for node, _, _, _ in cmds]
+
+    (tmp_path / "tree").mkdir()
+    executor = TestExecutor()
+    node = Node()
+    trees = [(str(tmp_path / "missing"), None, []), (str(tmp_path / "tree"), None, [])]
+
+    results = executor.sync_archives([(node, trees)])
+    assert len(executor.cmds) == 1
+    assert results[0][:2] == (node, False)
+    assert results[0][2].startswith("cannot create archive of")
+    assert results[1] == (node, True, "")
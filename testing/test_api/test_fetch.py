@@ -0,0 +1,85 @@
+import base64
+import os
+import zlib
+
+import pytest
+
+from ZeekControl.fetch import PARTSUFFIX, NodeFetch, parse_listing
+
+
+def chunk(size, data, mtime=100):
+    encoded = base64.b64encode(zlib.compress(data)).decode()
+    return f"{size} {mtime} {len(data)}\n{encoded}\n"
+
+
+def test_fetch_parse_listing():
+    assert parse_listing("-\n") is None
+    assert parse_listing("3 100 spool/a b\n0 100 spool/c\n") == [
+        (3, 100, "spool/a b"),
+        (0, 100, "spool/c"),
+    ]
+
+    with pytest.raises(ValueError):
+        parse_listing("3 100 ../etc/passwd\n")
+    with pytest.raises(ValueError):
+        parse_listing("many 100 spool/a\n")
+
+
+def test_fetch_chunks(tmp_path):
+    nf = NodeFetch("/zeek", str(tmp_path), [(6, 100, "a"), (2, 100, "b")], 4)
+
+    assert nf.args() == ["/zeek/a", "0", "4"]
+    nf.feed(chunk(6, b"abcd"))
+    assert not nf.done()
+
+    # The rest of the first file and all of the second one fit in a round.
+    assert nf.args() == ["/zeek/a", "4", "2", "/zeek/b", "0", "2"]
+    nf.feed(chunk(6, b"ef") + chunk(2, b"gh"))
+    assert nf.done()
+
+    assert (tmp_path / "a").read_bytes() == b"abcdef"
+    assert (tmp_path / "b").read_bytes() == b"gh"
+    assert os.stat(tmp_path / "a").st_mtime == 100
+    assert nf.fetched == 2 and nf.received == 8 and not nf.errors
+
+    # Unchanged files are skipped the next time.
+    nf = NodeFetch("/zeek", str(tmp_path), [(6, 100, "a"), (3, 200, "b")], 4)
+    assert nf.skipped == 1
+    assert nf.args() == ["/zeek/b", "0", "3"]
+
+
+def test_fetch_resume(tmp_path):
+    nf = NodeFetch("/zeek", str(tmp_path), [(6, 100, "a")], 4)
+    nf.args()
+    nf.feed(chunk(6, b"abcd"))
+
+    # An interrupted fetch resumes if the file did not change ...
+    nf = NodeFetch("/zeek", str(tmp_path), [(6, 100, "a")], 4)
+    assert nf.resumed == 1
+    assert nf.args() == ["/zeek/a", "4", "2"]
+
+    # ... and starts over otherwise.
+    nf = NodeFetch("/zeek", str(tmp_path), [(6, 101, "a")], 4)
+    assert nf.resumed == 0
+    assert nf.args() == ["/zeek/a", "0", "4"]
+    nf.feed(chunk(6, b"wxyz", 101))
+    nf.args()
+    nf.feed(chunk(6, b"!!", 101))
+    assert (tmp_path / "a").read_bytes() == b"wxyz!!"
+    assert not (tmp_path / ("a" + PARTSUFFIX)).exists()
+
+
+def test_fetch_errors(tmp_path):
+    nf = NodeFetch("/zeek", str(tmp_path), [(6, 100, "a"), (2, 100, "b")], 10)
+    nf.args()
+    nf.feed("-\n" + chunk(1, b"g"))
+    assert nf.done()
+    assert nf.errors == [
+        "/zeek/a: file vanished",
+        "/zeek/b: file shrank while fetching",
+    ]
+
+    nf = NodeFetch("/zeek", str(tmp_path), [(2, 100, "c")], 10)
+    nf.args()
+    with pytest.raises(ValueError):
+        nf.feed("2 100 2\nnot base64\n")
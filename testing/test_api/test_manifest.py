@@ -0,0 +1,81 @@
+import os
+
+from ZeekControl.manifest import ManifestStore, build, diff, digest
+
+
+def make_tree(top):
+    (top / "sub").mkdir(parents=True)
+    (top / "a").write_text("a")
+    (top / "sub" / "b").write_text("b")
+    os.symlink("a", top / "link")
+
+
+def test_manifest_build(tmp_path):
+    make_tree(tmp_path / "tree")
+    m = build(str(tmp_path / "tree"))
+
+    assert sorted(m) == [".", "a", "link", "sub", "sub/b"]
+    assert m["."][0] == "d"
+    assert m["a"][:2] == ["f", 1]
+    assert m["link"][0] == "l"
+
+    # A single file is a tree of its own.
+    assert list(build(str(tmp_path / "tree" / "a"))) == ["."]
+
+
+def test_manifest_digest_ignores_mtime(tmp_path):
+    make_tree(tmp_path / "tree")
+    m = build(str(tmp_path / "tree"))
+    d = digest(m)
+
+    os.utime(tmp_path / "tree" / "a", (1, 1))
+    assert digest(build(str(tmp_path / "tree"), m)) == d
+
+    (tmp_path / "tree" / "a").write_text("x")
+    assert digest(build(str(tmp_path / "tree"), m)) != d
+
+
+def test_manifest_reuses_hashes(tmp_path):
+    make_tree(tmp_path / "tree")
+    m = build(str(tmp_path / "tree"))
+
+    # A file with the same size and mtime is not rehashed.
+    m["a"][2] = "cached"
+    assert build(str(tmp_path / "tree"), m)["a"][2] == "cached"
+
+
+def test_manifest_diff():
+    old = {
+        ".": ["d", 0, "", 0],
+        "a": ["f", 1, "h1", 0],
+        "b": ["f", 1, "h2", 0],
+        "dir": ["d", 0, "", 0],
+        "dir/c": ["f", 1, "h3", 0],
+        "x": ["f", 1, "h4", 0],
+    }
+    new = {
+        ".": ["d", 0, "", 5],
+        "a": ["f", 1, "h1", 5],
+        "b": ["f", 2, "h5", 5],
+        "x": ["d", 0, "", 0],
+        "y": ["f", 1, "h6", 0],
+    }
+
+    assert diff(old, new) == (["b", "x", "y"], ["dir", "x"])
+    assert diff(new, new) == ([], [])
+
+
+def test_manifest_store(tmp_path):
+    store = ManifestStore(str(tmp_path / "manifests"))
+    m = {".": ["f", 1, "h", 0]}
+
+    d = store.save(m)
+    assert d == digest(m)
+    assert store.load(d) == m
+    assert store.load(None) is None
+    assert store.load("unknown") is None
+
+    store.prune({d})
+    assert store.load(d) == m
+    store.prune(set())
+    assert store.load(d) is None
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+from ZeekControl.messagedb import MessageStore
+
+SUMMARIZE = os.path.join(
+    os.path.dirname(__file__), "..", "..", "bin", "helpers", "summarize-messages"
+)
+
+
+def test_messagedb_counts():
+    s = MessageStore(":memory:")
+    assert s.get_offset("worker-1", "stderr.log") == (0, 0)
+
+    new = s.add(
+        "worker-1",
+        "stderr.log",
+        42,
+        100,
+        [(3, "stderr", "error <num>", "error 7"), (1, "stderr", "other", "other")],
+        10.0,
+    )
+    assert new == [
+        ("stderr", "error <num>", "error 7"),
+        ("stderr", "other", "other"),
+    ]
+    assert s.get_offset("worker-1", "stderr.log") == (42, 100)
+
+    # A template seen before is not new, even on another node.
+    new = s.add(
+        "worker-2",
+        "stderr.log",
+        43,
+        50,
+        [(5, "stderr", "error <num>", "error 8")],
+        20.0,
+    )
+    assert new == []
+
+    top = s.top(10)
+    assert top[0] == ("stderr", "error <num>", "error 8", 8, 2, 10.0, 20.0)
+    assert top[1][:5] == ("stderr", "other", "other", 1, 1)
+
+    assert s.top(1, nodes=["worker-2"]) == [
+        ("stderr", "error <num>", "error 8", 5, 1, 10.0, 20.0)
+    ]
+
+
+def test_messagedb_reset():
+    s = MessageStore(":memory:")
+    s.add("logger", "reporter.log", 1, 10, [(1, "warning", "x", "x")], 1.0)
+    s.reset()
+
+    assert s.top() == []
+    assert s.get_offset("logger", "reporter.log") == (1, 10)
+    assert s.add("logger", "reporter.log", 1, 20, [(1, "warning", "x", "x")], 2.0)
+
+
+def summarize(path, inode, offset, maxbytes):
+    out = subprocess.run(
+        [sys.executable, SUMMARIZE, str(path), str(inode), str(offset), str(maxbytes)],
+        capture_output=True,
+        check=True,
+    ).stdout.decode()
+    header, *lines = out.splitlines()
+    return [int(v) for v in header.split()], lines
+
+
+def test_summarize_messages_skips_backlog(tmp_path):
+    log = tmp_path / "stderr.log"
+    log.write_text("".join(f"error {i}\n" for i in range(100)))
+    size = log.stat().st_size
+    inode = log.stat().st_ino
+
+    (_, offset, _, skipped), lines = summarize(log, 0, 0, 10000)
+    assert (offset, skipped) == (size, 0)
+    assert lines == ["100\tstderr\terror <num>\terror 99"]
+
+    # Only the last "maxbytes" of a longer backlog are read, starting at a
+    # line boundary, and the rest is reported as skipped.
+    (_, offset, _, skipped), lines = summarize(log, inode, 0, 20)
+    assert (offset, skipped) == (size, size - 18)
+    assert lines == ["2\tstderr\terror <num>\terror 99"]
@@ -1,3 +1,5 @@
+import threading
+
 from ZeekControl.state import SqliteState
 
 
@@ -45,3 +47,19 @@ def test_state_items():
 
     assert d["a"] == 1
     assert d["b"] == "two"
+
+
+def test_state_threads():
+    s = SqliteState(":memory:")
+
+    def setkeys(prefix):
+        for i in range(50):
+            s.set(f"{prefix}-{i}", i)
+
+    threads = [threading.Thread(target=setkeys, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(s.items()) == 200
@@ -0,0 +1,192 @@
+import time
+
+import pytest
+
+from ZeekControl.statsdb import (
+    StatsStore,
+    aggregate,
+    check_aggregates,
+    parse_time,
+    percentile,
+)
+
+
+def make_store():
+    s = StatsStore(":memory:")
+    s.add(
+        [
+            (100.0, "worker-1", "parent", "cpu", 10),
+            (100.0, "worker-1", "parent", "vsize", 1000),
+            (100.0, "worker-2", "parent", "cpu", 20),
+            (200.0, "worker-1", "parent", "cpu", 30),
+            (200.0, "worker-1", "error", "error", "cannot connect"),
+            (300.0, "worker-2", "interface", "mbps", 1.5),
+        ]
+    )
+    return s
+
+
+def test_statsdb_query():
+    s = make_store()
+
+    assert len(s.query()) == 6
+
+    rows = s.query(nodes=["worker-1"], metrics=["cpu"])
+    assert rows == [
+        (100.0, "worker-1", "parent", "cpu", 10),
+        (200.0, "worker-1", "parent", "cpu", 30),
+    ]
+
+    rows = s.query(start=100.0, end=200.0, metrics=["cpu"])
+    assert [r[1] for r in rows] == ["worker-1", "worker-2"]
+
+    rows = s.query(types=["interface"])
+    assert rows == [(300.0, "worker-2", "interface", "mbps", 1.5)]
+
+
+def test_statsdb_values():
+    s = make_store()
+
+    rows = s.query(types=["error"])
+    assert rows[0][4] == "cannot connect"
+
+
+def test_statsdb_latest():
+    s = make_store()
+
+    # An older sample added later must not replace the latest value.
+    s.add([(150.0, "worker-1", "parent", "cpu", 99)])
+
+    latest = s.latest(nodes=["worker-1"])
+    assert latest[("worker-1", "parent", "cpu")] == (200.0, 30)
+    assert latest[("worker-1", "parent", "vsize")] == (100.0, 1000)
+    assert ("worker-2", "parent", "cpu") not in latest
+
+    assert s.nodes() == ["worker-1", "worker-2"]
+
+
+def test_statsdb_expire():
+    s = make_store()
+
+    assert s.expire(200.0) == 3
+    assert [r[0] for r in s.query()] == [200.0, 200.0, 300.0]
+
+    latest = s.latest()
+    assert ("worker-1", "parent", "vsize") not in latest
+    assert ("worker-1", "parent", "cpu") in latest
+
+
+def test_statsdb_rollup():
+    s = StatsStore(":memory:")
+    s.add(
+        [
+            (3600.0, "worker-1", "parent", "cpu", 10),
+            (3630.0, "worker-1", "parent", "cpu", 30),
+            (3660.0, "worker-1", "parent", "cpu", 20),
+            (3660.0, "worker-1", "parent", "cmd", "zeek"),
+        ]
+    )
+
+    tier, rows = s.rollup(tier=60)
+    assert tier == 60
+    assert rows == [
+        (3600.0, "worker-1", "parent", "cpu", 2, 20.0, 10.0, 30.0),
+        (3660.0, "worker-1", "parent", "cpu", 1, 20.0, 20.0, 20.0),
+    ]
+
+    tier, rows = s.rollup(tier=3600)
+    assert rows == [(3600.0, "worker-1", "parent", "cpu", 3, 20.0, 10.0, 30.0)]
+
+    # Non-numeric values are skipped for raw samples, too.
+    tier, rows = s.rollup(tier=0)
+    assert len(rows) == 3
+
+
+def test_statsdb_select_tier():
+    s = StatsStore(":memory:")
+    day = 86400.0
+    s.add([(10 * day + 30, "worker-1", "parent", "cpu", 1)])
+
+    # The raw samples cover a short range.
+    assert s.select_tier(10 * day, 10 * day + 3600) == 0
+
+    # A long range uses the hourly rollups.
+    assert s.select_tier(10 * day, 13 * day) == 3600
+
+    # Once the raw samples are expired, the minute rollups are used.
+    s.expire(11 * day)
+    s.add([(11 * day, "worker-1", "parent", "cpu", 1)])
+    assert s.select_tier(10 * day, 10 * day + 3600) == 60
+
+    s.expire(11 * day, 60)
+    assert s.select_tier(10 * day, 10 * day + 3600) == 3600
+
+
+def test_statsdb_parse_time():
+    now = 1000000.0
+
+    assert parse_time("now", now) == now
+    assert parse_time("90m", now) == now - 5400
+    assert parse_time("2d", now) == now - 172800
+    assert parse_time("12345.5", now) == 12345.5
+    assert parse_time("2024-05-07T13:30") == time.mktime(
+        (2024, 5, 7, 13, 30, 0, 0, 0, -1)
+    )
+
+    with pytest.raises(ValueError):
+        parse_time("yesterday", now)
+
+
+def test_statsdb_check_aggregates():
+    check_aggregates(["avg", "max", "p95", "p99.9", "rate"])
+
+    for agg in ("median", "p101", "px"):
+        with pytest.raises(ValueError):
+            check_aggregates([agg])
+
+
+def test_statsdb_aggregate():
+    rows = [
+        (100.0, "worker-1", "parent", "utime", 1, 10.0, 10.0, 10.0),
+        (100.0, "worker-2", "parent", "utime", 1, 20.0, 20.0, 20.0),
+        (200.0, "worker-1", "parent", "utime", 1, 30.0, 30.0, 30.0),
+        (200.0, "worker-2", "parent", "utime", 1, 60.0, 60.0, 60.0),
+    ]
+
+    result = aggregate(rows, ["count", "avg", "min", "max", "rate"], lambda r: r[1])
+    assert result == [
+        (
+            ("worker-1", "parent", "utime"),
+            {"count": 2, "avg": 20.0, "min": 10.0, "max": 30.0, "rate": 0.2},
+        ),
+        (
+            ("worker-2", "parent", "utime"),
+            {"count": 2, "avg": 40.0, "min": 20.0, "max": 60.0, "rate": 0.4},
+        ),
+    ]
+
+    # Over all nodes, the rates of the nodes are summed up.
+    result = aggregate(rows, ["avg", "p50", "rate"], lambda r: "all")
+    group, vals = result[0]
+    assert group == ("all", "parent", "utime")
+    assert vals["avg"] == 30.0
+    assert vals["p50"] == 25.0
+    assert vals["rate"] == pytest.approx(0.6)
+
+
+def test_statsdb_aggregate_weighted():
+    # Rollup rows are weighted by the number of samples they contain.
+    rows = [
+        (0.0, "worker-1", "parent", "cpu", 3, 10.0, 5.0, 20.0),
+        (60.0, "worker-1", "parent", "cpu", 1, 50.0, 50.0, 50.0),
+    ]
+
+    result = aggregate(rows, ["count", "avg", "min", "max"], lambda r: r[1])
+    assert result[0][1] == {"count": 4, "avg": 20.0, "min": 5.0, "max": 50.0}
+
+
+def test_statsdb_percentile():
+    assert percentile([5], 95) == 5
+    assert percentile([4, 1, 3, 2], 0) == 1
+    assert percentile([4, 1, 3, 2], 100) == 4
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
@@ -0,0 +1,241 @@
+import os
+
+import pytest
+
+from ZeekControl import execute
+from ZeekControl.control import Controller
+
+
+class Node:
+    def __init__(self, name, host, sync_group=""):
+        self.name = name
+        self.host = host
+        self.addr = host
+        self.sync_group = sync_group
+
+    def __repr__(self):
+        return self.name
+
+
+class Config:
+    def __init__(self, tmp_path, nodes):
+        self.installmanifestdir = str(tmp_path / "manifests")
+        self.installtransport = "rsync"
+        self.syncmaxjobs = 0
+        self.state = {}
+        self._nodes = nodes
+
+    def nodes(self):
+        return self._nodes
+
+    def get_state(self, key):
+        return self.state.get(key)
+
+    def set_state(self, key, val):
+        self.state[key] = val
+
+    def options(self):
+        return list(self.state.items())
+
+
+class UI:
+    def __init__(self):
+        self.msgs = []
+
+    def info(self, txt):
+        self.msgs.append(txt)
+
+    error = info
+
+
+class Executor:
+    def __init__(self):
+        self.cmds = []
+        self.archives = []
+        self.relayed = []
+        self.relayfail = set()
+
+    def run_cmds(self, cmds):
+        self.cmds += cmds
+        return [(node, True, "") for node, _, _ in cmds]
+
+    def sync_archives(self, jobs, maxjobs=0):
+        self.archives += jobs
+        return [(node, True, "") for node, trees in jobs for _ in trees]
+
+    def relay_sync(self, jobs, maxjobs=0):
+        self.relayed += jobs
+        return [(node, node not in self.relayfail, "") for _, node, _ in jobs]
+
+
+class Install:
+    def __init__(self, tmp_path, nodes, monkeypatch):
+        self.config = Config(tmp_path, nodes)
+        self.ui = UI()
+        self.executor = Executor()
+        self.jobs = []
+        self.syncfail = set()
+
+        def sync_delta(jobs, cmdout, maxjobs=0):
+            self.jobs = jobs
+            return {node for node, _, _ in jobs if node not in self.syncfail}
+
+        monkeypatch.setattr(execute, "sync_delta", sync_delta)
+
+    def _sync_relays(self, nodes):
+        return Controller._sync_relays(self, nodes)
+
+    def sync(self, nodes, paths, full=False, relayfail=()):
+        self.jobs = []
+        self.executor = Executor()
+        self.executor.relayfail = set(relayfail)
+        self.ui.msgs = []
+        return Controller._sync_trees(self, nodes, paths, full)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    path = tmp_path / "tree"
+    (path / "sub").mkdir(parents=True)
+    (path / "a").write_text("a")
+    (path / "sub" / "b").write_text("b")
+    return str(path)
+
+
+def test_sync_trees(tmp_path, tree, monkeypatch):
+    nodes = [Node("worker-1", "host1"), Node("worker-2", "host2")]
+    install = Install(tmp_path, nodes, monkeypatch)
+
+    # Hosts without a manifest get the whole tree.
+    assert install.sync(nodes, [tree])
+    assert install.jobs == [(nodes[0], [tree], []), (nodes[1], [tree], [])]
+
+    # Nothing is copied to hosts that are up to date.
+    assert install.sync(nodes, [tree])
+    assert install.jobs == []
+    assert install.ui.msgs == ["2 of 2 hosts already up to date"]
+
+    # Only the changed files are copied, and removed ones are deleted.
+    with open(os.path.join(tree, "a"), "w") as f:
+        f.write("changed")
+    os.unlink(os.path.join(tree, "sub", "b"))
+    assert install.sync(nodes, [tree])
+    a = os.path.join(tree, "a")
+    b = os.path.join(tree, "sub", "b")
+    assert install.jobs == [(nodes[0], [], [a]), (nodes[1], [], [a])]
+    assert install.executor.cmds == [
+        (nodes[0], "rm", ["-rf", "--", b]),
+        (nodes[1], "rm", ["-rf", "--", b]),
+    ]
+
+    # A full install mirrors the whole tree again.
+    assert install.sync(nodes[:1], [tree], full=True)
+    assert install.jobs == [(nodes[0], [tree], [])]
+
+
+def test_sync_trees_archive(tmp_path, tree, monkeypatch):
+    nodes = [Node("worker-1", "host1")]
+    install = Install(tmp_path, nodes, monkeypatch)
+    install.config.installtransport = "archive"
+
+    # Whole trees are mirrored with rsync.
+    assert install.sync(nodes, [tree])
+    assert install.executor.archives == []
+    assert install.jobs == [(nodes[0], [tree], [])]
+
+    # Changes are sent as archives.
+    os.unlink(os.path.join(tree, "a"))
+    assert install.sync(nodes, [tree])
+    assert install.executor.archives == [(nodes[0], [(tree, [], ["a"])])]
+    assert install.executor.cmds == []
+    assert install.jobs == []
+
+    # Changes that are too large for an archive are mirrored with rsync.
+    monkeypatch.setattr(execute, "ARCHIVE_MAXBYTES", 5)
+    (tmp_path / "tree" / "c").write_text("large file")
+    assert install.sync(nodes, [tree])
+    assert install.executor.archives == []
+    assert install.jobs == [(nodes[0], [tree], [])]
+
+
+def test_sync_trees_relay(tmp_path, tree, monkeypatch):
+    nodes = [
+        Node("worker-1", "host1", "dc1"),
+        Node("worker-2", "host2", "dc1"),
+        Node("worker-3", "host3", "dc1"),
+        Node("worker-4", "host4"),
+    ]
+    install = Install(tmp_path, nodes, monkeypatch)
+
+    # Only the first host of the group is updated directly, and it mirrors
+    # the tree to the other hosts of the group.
+    assert install.sync(nodes, [tree])
+    assert install.jobs == [(nodes[0], [tree], []), (nodes[3], [tree], [])]
+    assert install.executor.relayed == [
+        (nodes[0], nodes[1], [tree]),
+        (nodes[0], nodes[2], [tree]),
+    ]
+    pushed = install.config.get_state("install-manifests-host1")
+    for node in nodes:
+        assert install.config.get_state(f"install-manifests-{node.host}") == pushed
+
+    # If the update of the relay fails, its peers are not updated either.
+    with open(os.path.join(tree, "a"), "w") as f:
+        f.write("changed")
+    install.syncfail = {nodes[0]}
+    assert not install.sync(nodes, [tree])
+    assert install.executor.relayed == []
+    assert install.ui.msgs == [
+        "cannot update host2: update of host1 failed",
+        "cannot update host3: update of host1 failed",
+    ]
+    for node in nodes[:3]:
+        assert install.config.get_state(f"install-manifests-{node.host}") == pushed
+    assert install.config.get_state("install-manifests-host4") != pushed
+
+    # A failed relayed update affects only its destination.
+    install.syncfail = set()
+    assert not install.sync(nodes, [tree], relayfail=[nodes[2]])
+    assert install.jobs == [(nodes[0], [], [os.path.join(tree, "a")])]
+    assert install.executor.relayed == [
+        (nodes[0], nodes[1], [tree]),
+        (nodes[0], nodes[2], [tree]),
+    ]
+    assert install.ui.msgs == [
+        "rsync to host3 failed: ",
+        "1 of 4 hosts already up to date",
+    ]
+    pushed = install.config.get_state("install-manifests-host1")
+    assert install.config.get_state("install-manifests-host2") == pushed
+    assert install.config.get_state("install-manifests-host3") != pushed
+
+
+def test_relay_sync_batches():
+    relay1 = Node("worker-1", "host1")
+    relay2 = Node("worker-4", "host4")
+    nodes = [Node("worker-2", "host2"), Node("worker-3", "host3")]
+    rounds = []
+
+    class RelayExecutor:
+        def run_cmds(self, cmds, shell=False):
+            rounds.append([(node.host, cmd) for node, cmd, _ in cmds])
+            return [(node, "host3" not in cmd, "") for node, cmd, _ in cmds]
+
+    jobs = [
+        (relay1, nodes[0], ["/zeek"]),
+        (relay1, nodes[1], ["/zeek"]),
+        (relay2, Node("worker-5", "host5"), ["/zeek"]),
+    ]
+    results = execute.Executor.relay_sync(RelayExecutor(), jobs, maxjobs=1)
+
+    # Each relay runs at most "maxjobs" rsyncs at a time.
+    assert [[host for host, _ in cmds] for cmds in rounds] == [
+        ["host1", "host4"],
+        ["host1"],
+    ]
+    assert rounds[0][0][1] == execute.mirror_cmdline(["/zeek"], nodes[0])
+    assert [(node.host, success) for node, success, _ in results] == [
+        ("host2", True),
+        ("host5", True),
+        ("host3", False),
+    ]
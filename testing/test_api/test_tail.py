@@ -0,0 +1,68 @@
+import base64
+
+from ZeekControl.tail import MAXBACKLOG, MAXBYTES, LogTail
+
+
+def output(size, offset, data):
+    if isinstance(data, str):
+        data = data.encode()
+    return f"{size} {offset} {len(data)}\n{base64.b64encode(data).decode()}\n"
+
+
+def test_tail_starts_with_last_lines():
+    t = LogTail("stderr.log", lines=2)
+    assert t.args() == ["stderr.log", str(-MAXBYTES), str(MAXBYTES)]
+
+    # The first line is dropped, as the read started in the middle of it.
+    assert t.feed(output(98, 88, "ne1\nl2\nl3\n"), 0) == ["l2", "l3"]
+    assert t.args()[1] == "98"
+
+
+def test_tail_follows_partial_lines():
+    t = LogTail("stderr.log", lines=10)
+    assert t.feed(output(4, 0, "a\nb"), 0) == ["a"]
+    assert t.feed(output(8, 4, "c\nd\n"), 1) == ["bc", "d"]
+    assert t.feed(output(8, 8, ""), 2) == []
+    assert t.args()[1] == "8"
+
+
+def test_tail_missing_and_truncated_file():
+    t = LogTail("stdout.log")
+    assert t.feed("-\n", 0) == []
+    assert t.args()[1] == "0"
+
+    assert t.feed(output(6, 0, "a\nb\nc\n"), 1) == ["a", "b", "c"]
+
+    # The helper reads from the start if the file became shorter.
+    assert t.feed(output(2, 0, "x\n"), 2) == ["x", "[file truncated]"]
+
+
+def test_tail_rate_limit():
+    t = LogTail("stderr.log", lines=0, maxrate=3)
+    assert t.feed(output(0, 0, ""), 0) == []
+
+    data = "".join(f"{i}\n" for i in range(5))
+    assert t.feed(output(10, 0, data), 0.5) == ["0", "1", "2", "[2 lines dropped]"]
+
+    # The allowance grows with the time since the last read.
+    assert t.feed(output(14, 10, "5\n6\n"), 1.0) == ["5", "[1 lines dropped]"]
+    assert t.feed(output(16, 14, "7\n"), 2.0) == ["7"]
+
+
+def test_tail_skips_backlog():
+    t = LogTail("stderr.log", lines=0)
+    assert t.feed(output(0, 0, ""), 0) == []
+
+    size = MAXBYTES + MAXBACKLOG + 10
+    lines = t.feed(output(size, 0, "a\n" + "x" * (MAXBYTES - 2)), 1)
+    assert lines == ["a", f"[{MAXBACKLOG + 10} bytes skipped]"]
+    assert t.args()[1] == str(size)
+
+
+def test_tail_multibyte_character_split():
+    t = LogTail("stderr.log")
+    assert t.feed(output(0, 0, ""), 0) == []
+
+    data = "grüße\n".encode()
+    assert t.feed(output(3, 0, data[:3]), 1) == []
+    assert t.feed(output(len(data), 3, data[3:]), 2) == ["grüße"]
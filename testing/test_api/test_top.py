@@ -0,0 +1,73 @@
+from ZeekControl.control import PROCSTATS_UNSUPPORTED, Controller
+
+
+class Node:
+    def __init__(self, name, host, pid):
+        self.name = name
+        self.host = host
+        self.pid = pid
+
+    def getPID(self):
+        return self.pid
+
+
+class Executor:
+    def __init__(self):
+        self.cmds = []
+
+    def run_helper(self, cmds):
+        self.cmds.append([(node.host, helper, args) for node, helper, args in cmds])
+        results = []
+        for node, helper, args in cmds:
+            if helper == "top":
+                results.append((node, True, f"{node.pid} 100 50 3 zeek\n"))
+            elif node.host == "bsd":
+                results.append((node, False, PROCSTATS_UNSUPPORTED + "\n"))
+            elif node.host == "broken":
+                results.append((node, True, "vsize=1 rss=2 cmd=zeek\n"))
+            else:
+                out = "".join(
+                    f"pid={pid} vsize=100 rss=50 utime=1.00 stime=2.00 cpu=3 cmd=zeek\n"
+                    for pid in args[1:]
+                )
+                results.append((node, True, out))
+        return results
+
+
+def make_controller():
+    controller = Controller.__new__(Controller)
+    controller.executor = Executor()
+    controller._noprocstats = set()
+    controller._isrunning = lambda nodes: [(node, True) for node in nodes]
+    return controller
+
+
+def test_top_helper_per_host():
+    nodes = [Node("w1", "linux", 1), Node("w2", "bsd", 2), Node("w3", "linux", 3)]
+    controller = make_controller()
+
+    results = controller.get_top_output(nodes)
+    assert [(node.name, error) for node, error, _ in results] == [
+        ("w1", None),
+        ("w2", None),
+        ("w3", None),
+    ]
+    assert results[0][2]["utime"] == 1.0
+    assert results[1][2]["cpu"] == "3"
+    assert controller.executor.cmds == [
+        [("linux", "procstats", ["1", "1", "3"]), ("bsd", "procstats", ["1", "2"])],
+        [("bsd", "top", [])],
+    ]
+
+    # The host without /proc is remembered.
+    controller.executor.cmds = []
+    controller.get_top_output(nodes)
+    assert controller.executor.cmds == [
+        [("linux", "procstats", ["1", "1", "3"]), ("bsd", "top", [])]
+    ]
+
+
+def test_top_malformed_procstats_output():
+    controller = make_controller()
+    results = controller.get_top_output([Node("w1", "broken", 1)])
+    assert results[0][1].startswith("unexpected procstats output")